@@ -0,0 +1,92 @@
+"""
+Pre-synthesized audio bank for fixed replies and greetings.
+
+Strings the backend says over and over (the chat and image-analysis fallback
+replies, and a greeting per language) are rendered offline for every TTS voice
+and audio format (MP3 and the Opus profiles) by build_audio_bank.py into one
+pack file, loaded at startup and served without an upstream call.
+
+Pack layout: MAGIC, a 4-byte big-endian index length, a UTF-8 JSON index, then
+the concatenated clips. Each index entry records the TTS cache key of its audio
+(the same content key synthesize_chunk computes), so a banked string is found
+by the ordinary TTS lookup whatever endpoint asked for it.
+"""
+
+import json
+import struct
+from pathlib import Path
+
+import log
+
+MAGIC = b"HSAB\x01"
+
+# Greeting played when a conversation starts, one per TTS language
+GREETINGS = {
+    "ta-IN": "வணக்கம்! உங்கள் விவசாய உதவியாளர் ஹசிரிக்கு வரவேற்கிறோம். இன்று நான் உங்களுக்கு எப்படி உதவ முடியும்?",
+    "hi-IN": "नमस्ते! आपकी कृषि सहायक हसिरी में आपका स्वागत है। आज मैं आपकी क्या मदद कर सकती हूँ?",
+    "te-IN": "నమస్కారం! మీ వ్యవసాయ సహాయకురాలు హసిరికి స్వాగతం. ఈ రోజు నేను మీకు ఎలా సహాయం చేయగలను?",
+    "kn-IN": "ನಮಸ್ಕಾರ! ನಿಮ್ಮ ಕೃಷಿ ಸಹಾಯಕಿ ಹಸಿರಿಗೆ ಸ್ವಾಗತ. ಇಂದು ನಾನು ನಿಮಗೆ ಹೇಗೆ ಸಹಾಯ ಮಾಡಬಹುದು?",
+    "ml-IN": "നമസ്കാരം! നിങ്ങളുടെ കൃഷി സഹായിയായ ഹസിരിയിലേക്ക് സ്വാഗതം. ഇന്ന് ഞാൻ നിങ്ങളെ എങ്ങനെ സഹായിക്കണം?",
+    "bn-IN": "নমস্কার! আপনার কৃষি সহায়ক হাসিরিতে স্বাগতম। আজ আমি আপনাকে কীভাবে সাহায্য করতে পারি?",
+    "gu-IN": "નમસ્તે! તમારા કૃષિ સહાયક હસિરીમાં આપનું સ્વાગત છે. આજે હું તમારી કેવી રીતે મદદ કરી શકું?",
+    "pa-IN": "ਸਤ ਸ੍ਰੀ ਅਕਾਲ! ਤੁਹਾਡੀ ਖੇਤੀ ਸਹਾਇਕ ਹਸਿਰੀ ਵਿੱਚ ਤੁਹਾਡਾ ਸਵਾਗਤ ਹੈ। ਅੱਜ ਮੈਂ ਤੁਹਾਡੀ ਕਿਵੇਂ ਮਦਦ ਕਰ ਸਕਦੀ ਹਾਂ?",
+    "mr-IN": "नमस्कार! तुमच्या कृषी सहाय्यक हसिरीमध्ये तुमचे स्वागत आहे. आज मी तुम्हाला कशी मदत करू शकते?",
+    "en-US": "Hello! Welcome to HASIRI, your farming assistant. How can I help you today?",
+}
+
+
+def write_pack(path: Path, entries: list):
+    """
+    Write (metadata dict, audio bytes) pairs as a pack. metadata must contain
+    "key", "phrase", "languageCode" and "format"; offsets are filled in here.
+    """
+    index = []
+    offset = 0
+    for meta, audio_bytes in entries:
+        index.append({**meta, "offset": offset, "length": len(audio_bytes)})
+        offset += len(audio_bytes)
+    index_bytes = json.dumps(index, ensure_ascii=False).encode("utf-8")
+    path = Path(path)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC + struct.pack(">I", len(index_bytes)) + index_bytes)
+        for _, audio_bytes in entries:
+            f.write(audio_bytes)
+    tmp_path.replace(path)
+
+
+class AudioBank:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._data = b""
+        self._by_key = {}  # audio key -> (offset, length)
+
+        self.hits = 0
+
+    def load(self):
+        if not self.path.exists():
+            # Fixed replies and greetings are synthesized on demand instead
+            log.info("audio_bank.missing", path=str(self.path))
+            return
+        data = self.path.read_bytes()
+        if not data.startswith(MAGIC):
+            log.warning("audio_bank.invalid", path=str(self.path))
+            return
+        header = len(MAGIC) + 4
+        (index_length,) = struct.unpack(">I", data[len(MAGIC):header])
+        index = json.loads(data[header:header + index_length].decode("utf-8"))
+        base = header + index_length
+        self._data = data
+        self._by_key = {entry["key"]: (base + entry["offset"], entry["length"]) for entry in index}
+        log.info("audio_bank.loaded", clips=len(self._by_key), bytes=len(data))
+
+    def get(self, audio_key: str):
+        location = self._by_key.get(audio_key)
+        if location is None:
+            return None
+        self.hits += 1
+        offset, length = location
+        return self._data[offset:offset + length]
+
+    def stats(self) -> dict:
+        return {"clips": len(self._by_key), "bytes": len(self._data), "hits": self.hits}
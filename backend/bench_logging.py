@@ -0,0 +1,100 @@
+"""
+Benchmark request throughput with print() logging, structured logging off, and
+structured logging on
+Each simulated request logs like speech_to_text: a few lines plus the full Speech
+API response (printed whole before; sampled by log.payload now). Output goes to
+/dev/null and to a slow sink standing in for a terminal or a backed-up log pipe.
+
+Usage: python bench_logging.py [requests]
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import log
+
+requests = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+CONCURRENCY = 100
+
+speech_response = {"results": [{
+    "alternatives": [{
+        "transcript": "நெல் பயிருக்கு சிறந்த உரம் எது " * 8,
+        "confidence": 0.92,
+        "words": [
+            {"startTime": f"{i * 0.4:.1f}s", "endTime": f"{i * 0.4 + 0.3:.1f}s", "word": "உரம்", "confidence": 0.9}
+            for i in range(48)
+        ],
+    }],
+    "languageCode": "ta-in",
+}]}
+
+
+class SlowSink:
+    """
+    A stream that takes 0.1 ms per write call, like a terminal or a full pipe.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        time.sleep(0.0001)
+        return self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+
+async def print_request(i: int):
+    print(f"🎤 Processing speech-to-text for file: voice-{i}.webm")
+    await asyncio.sleep(0)
+    print("🔍 Speech API response status: 200")
+    print(f"🔍 Full Speech API response: {speech_response}")
+    transcript = speech_response["results"][0]["alternatives"][0]["transcript"]
+    print(f"✅ Transcription successful: {transcript[:50]}...")
+    print("🌐 Final detected language: ta-in")
+
+
+async def structured_request(i: int):
+    token = log.request_id.set(log.new_request_id())
+    log.info("stt.request", filename=f"voice-{i}.webm")
+    await asyncio.sleep(0)
+    log.debug("stt.upstream_status", status=200)
+    log.payload("stt.upstream_response", speech_response)
+    transcript = speech_response["results"][0]["alternatives"][0]["transcript"]
+    log.info("stt.transcribed", transcript=transcript[:50], languageCode="ta-in")
+    log.request_id.reset(token)
+
+
+async def run(handler):
+    for batch in range(0, requests, CONCURRENCY):
+        await asyncio.gather(*(handler(i) for i in range(batch, min(batch + CONCURRENCY, requests))))
+
+
+def measure(mode: str, sink) -> tuple:
+    stdout = sys.stdout
+    sys.stdout = sink
+    log.ENABLED = mode != "structured off"
+    log.pipeline = log.LogPipeline(sink)
+    try:
+        start = time.perf_counter()
+        asyncio.run(run(print_request if mode == "print" else structured_request))
+        log.pipeline.stop()  # Count writing out the backlog against the run
+        return requests / (time.perf_counter() - start), log.pipeline.stats()
+    finally:
+        sys.stdout = stdout
+
+
+print(f"🧪 Logging throughput benchmark, {requests} simulated requests\n")
+print("=" * 60)
+with open(os.devnull, "w", encoding="utf-8") as devnull:
+    for sink_name, sink in (("/dev/null", devnull), ("slow sink", SlowSink(devnull))):
+        print(f"📤 {sink_name}")
+        for mode in ("print", "structured off", "structured on"):
+            rate, stats = measure(mode, sink)
+            written = f" ({stats['written']} records, {stats['dropped']} dropped)" if mode == "structured on" else ""
+            print(f"   {mode:>15}: {rate:9,.0f} requests/s{written}")
+print("-" * 60)
+print(f"ℹ️ Payload sample rate: {log.PAYLOAD_SAMPLE:.0%}, field cap {log.FIELD_MAX} chars")
@@ -0,0 +1,65 @@
+"""
+Benchmark semantic cache lookup latency at 1M entries
+Fills one language partition with synthetic unit vectors (embedding a million real
+questions would only measure the embedder), then times lookups of real questions.
+
+Usage: python bench_semantic_cache.py [entries]
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from semantic_cache import SemanticCache
+
+entries = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+
+questions = [
+    "best fertilizer for paddy",
+    "Best fertiliser for paddy crop?",
+    "PM-KISAN status kaise check kare",
+    "நெல் பயிருக்கு சிறந்த உரம் எது",
+    "धान के लिए सबसे अच्छा उर्वरक कौन सा है",
+    "tomato leaf curl virus treatment",
+]
+
+cache = SemanticCache({"en"}, max_entries=entries + len(questions))
+
+print(f"🧪 Semantic cache benchmark with {entries:,} entries\n")
+print("=" * 60)
+
+rng = np.random.default_rng(42)
+start = time.perf_counter()
+partition = cache._partition("en")
+batch = 100_000
+for lo in range(0, entries, batch):
+    n = min(batch, entries - lo)
+    vectors = rng.standard_normal((n, cache.embedder.dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    # Defer indexing to one training pass at the end, as load() does
+    partition.train_threshold = entries + 1
+    partition.add_many(vectors, [("", "|")] * n)
+partition.train_threshold = 4096
+partition._maybe_reindex()
+print(f"📦 Built index in {time.perf_counter() - start:.1f}s "
+      f"({len(partition.centroids)} lists, nprobe={partition.nprobe})")
+
+for question in questions:
+    cache.add(question, "en", f"reply to: {question}")
+
+timings = []
+for _ in range(200):
+    for question in questions:
+        t0 = time.perf_counter()
+        reply, similarity = cache.lookup(question, "en")
+        timings.append(time.perf_counter() - t0)
+
+timings_ms = np.array(timings) * 1000
+print(f"⏱️ Lookup latency: p50 {np.percentile(timings_ms, 50):.2f} ms, "
+      f"p95 {np.percentile(timings_ms, 95):.2f} ms, p99 {np.percentile(timings_ms, 99):.2f} ms")
+
+print("-" * 60)
+for question in ["best fertilizer for paddy?", "Which fertilizer is best for paddy", "wheat fertilizer"]:
+    reply, similarity = cache.lookup(question, "en")
+    print(f"🔎 {question!r}: similarity {similarity:.3f} -> {'HIT' if reply else 'MISS'}")
@@ -0,0 +1,92 @@
+"""
+Benchmark clean_text_for_tts against the original sequential-regex implementation
+Builds multilingual Gemini-style replies of 5-50 KB from the golden corpus, checks
+both implementations agree on every one, and compares throughput.
+
+Usage: python bench_tts_cleaning.py [rounds]
+"""
+
+import json
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+from tts_text import clean_text_for_tts
+
+rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+
+def legacy_clean_text_for_tts(text: str) -> str:
+    # The implementation tts_text replaced, kept verbatim as the baseline
+    if not text:
+        return ""
+    text = re.sub(r'\*\*([^*]+)\*\*', r'\1', text)
+    text = re.sub(r'\*([^*]+)\*', r'\1', text)
+    text = re.sub(r'__([^_]+)__', r'\1', text)
+    text = re.sub(r'_([^_]+)_', r'\1', text)
+    text = re.sub(r'`([^`]+)`', r'\1', text)
+    text = re.sub(r'```[^`]*```', '', text)
+    text = re.sub(r'^[\s]*[•·▪▫‣⁃]\s*', '', text, flags=re.MULTILINE)
+    text = re.sub(r'^[\s]*[-*+]\s*', '', text, flags=re.MULTILINE)
+    text = re.sub(r'^[\s]*\d+\.\s*', '', text, flags=re.MULTILINE)
+    text = re.sub(r'^#+\s*', '', text, flags=re.MULTILINE)
+    text = re.sub(r'\[([^\]]+)\]\([^)]+\)', r'\1', text)
+    text = re.sub(r'https?://[^\s]+', '', text)
+    text = re.sub(r'[#@$%^&*(){}[\]|\\<>]', '', text)
+    text = re.sub(r'[→←↑↓⟹⟸⟷]', '', text)
+    text = re.sub(r'[✓✗✘✔✕]', '', text)
+    text = re.sub(r'[©®™]', '', text)
+    text = re.sub(r'[°℃℉]', ' degrees ', text)
+    text = re.sub(r'[₹$£€¥]', '', text)
+    text = re.sub(r'[.]{2,}', '.', text)
+    text = re.sub(r'[-]{2,}', '-', text)
+    text = re.sub(r'[!]{2,}', '!', text)
+    text = re.sub(r'[?]{2,}', '?', text)
+    text = re.sub(r'[-–—]', ', ', text)
+    text = re.sub(r'[|]', ', ', text)
+    text = re.sub(r'[/]', ' or ', text)
+    text = re.sub(r'\b(etc\.?)\b', 'and so on', text, flags=re.IGNORECASE)
+    text = re.sub(r'\b(i\.e\.?)\b', 'that is', text, flags=re.IGNORECASE)
+    text = re.sub(r'\b(e\.g\.?)\b', 'for example', text, flags=re.IGNORECASE)
+    text = re.sub(r'\b(vs\.?)\b', 'versus', text, flags=re.IGNORECASE)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\n\s*\n', '\n', text)
+    return text.strip()
+
+
+with open(Path(__file__).parent / "tts_cleaning_golden.json", encoding="utf-8") as f:
+    paragraphs = [case["input"] for case in json.load(f) if case["input"].strip()]
+
+rng = random.Random(42)
+replies = []
+for target_kb in (5, 10, 20, 50):
+    for _ in range(5):
+        parts, size = [], 0
+        while size < target_kb * 1024:
+            paragraph = rng.choice(paragraphs)
+            parts.append(paragraph)
+            size += len(paragraph.encode("utf-8")) + 2
+        replies.append((target_kb, "\n\n".join(parts)))
+
+print(f"🧪 TTS cleaning benchmark: {len(replies)} replies, {rounds} rounds\n")
+print("=" * 60)
+
+mismatches = sum(clean_text_for_tts(text) != legacy_clean_text_for_tts(text) for _, text in replies)
+print(f"{'✅' if not mismatches else '❌'} Outputs identical on {len(replies) - mismatches}/{len(replies)} replies")
+print("-" * 60)
+
+for target_kb in (5, 10, 20, 50):
+    batch = [text for kb, text in replies if kb == target_kb]
+    megabytes = sum(len(text.encode("utf-8")) for text in batch) * rounds / 1e6
+    timings = {}
+    for name, fn in (("legacy", legacy_clean_text_for_tts), ("compiled", clean_text_for_tts)):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for text in batch:
+                fn(text)
+        timings[name] = time.perf_counter() - start
+    print(f"📏 ~{target_kb} KB replies: legacy {megabytes / timings['legacy']:.1f} MB/s, "
+          f"compiled {megabytes / timings['compiled']:.1f} MB/s "
+          f"({timings['legacy'] / timings['compiled']:.1f}x)")
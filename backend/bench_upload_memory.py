@@ -0,0 +1,95 @@
+"""
+Benchmark peak memory of turning an uploaded image into a Gemini request body
+Compares the old path (read the whole upload, base64 string, dict, httpx JSON
+serialization) with uploads.base64_json_body streaming from the spooled upload.
+Each variant runs in a fresh subprocess and reports its peak RSS above the
+baseline after setup; the request goes to a transport that drains the body.
+
+Usage: python bench_upload_memory.py [size in MB]
+"""
+
+import asyncio
+import base64
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from fastapi import UploadFile
+
+from uploads import BASE64_PLACEHOLDER, base64_json_body
+
+
+class SinkTransport(httpx.AsyncBaseTransport):
+    async def handle_async_request(self, request):
+        async for _ in request.stream:
+            pass
+        return httpx.Response(200)
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def template(data: str) -> dict:
+    return {"contents": [{"role": "user", "parts": [
+        {"text": "Analyze this crop image"},
+        {"inline_data": {"mime_type": "image/jpeg", "data": data}},
+    ]}]}
+
+
+async def legacy(upload: UploadFile, client: httpx.AsyncClient):
+    image_bytes = await upload.read()
+    image_base64 = base64.b64encode(image_bytes).decode("utf-8")
+    await client.post("http://upstream/", json=template(image_base64))
+
+
+async def streamed(upload: UploadFile, client: httpx.AsyncClient):
+    body, _ = await base64_json_body(template(BASE64_PLACEHOLDER), upload)
+    await client.post("http://upstream/", content=body, headers=body.headers())
+
+
+async def run(mode: str, size_mb: int):
+    # A spooled upload as Starlette leaves it: written in chunks, rolled over to disk
+    spool = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    for _ in range(size_mb):
+        spool.write(os.urandom(1024 * 1024))
+    spool.seek(0)
+    upload = UploadFile(spool, size=size_mb * 1024 * 1024, filename="leaf.jpg")
+    client = httpx.AsyncClient(transport=SinkTransport())
+    await streamed(UploadFile(tempfile.SpooledTemporaryFile(), size=0), client)  # Warm up imports
+
+    baseline = max(rss_mb(), peak_rss_mb())
+    start = time.perf_counter()
+    await (legacy if mode == "legacy" else streamed)(upload, client)
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"{peak_rss_mb() - baseline:.1f} {elapsed:.1f}")
+
+
+if len(sys.argv) > 2 and sys.argv[1] == "--run":
+    asyncio.run(run(sys.argv[2], int(sys.argv[3])))
+    sys.exit()
+
+size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+print(f"🧪 Upload ingestion memory benchmark with a {size_mb} MB image\n")
+print("=" * 60)
+results = {}
+for mode in ("legacy", "streamed"):
+    output = subprocess.run(
+        [sys.executable, __file__, "--run", mode, str(size_mb)],
+        capture_output=True, text=True, check=True
+    ).stdout.split()
+    results[mode] = float(output[0])
+    print(f"{mode:>8}: peak RSS +{float(output[0]):6.1f} MB per request, {float(output[1]):7.1f} ms")
+print("-" * 60)
+print(f"📉 Peak RSS per request: {results['legacy'] / max(results['streamed'], 0.1):.1f}x lower when streamed")
+print(f"   (base64 alone is {size_mb * 4 / 3:.1f} MB)")
@@ -0,0 +1,123 @@
+"""
+Per-upstream circuit breaker (closed / open / half-open).
+
+Outcomes are kept in a sliding time window. When the failure rate over the window
+crosses the threshold the breaker opens and calls are refused locally for
+open_seconds, so a degraded upstream costs milliseconds instead of a full timeout.
+After that a limited number of half-open probe calls decide whether to close again.
+"""
+
+import math
+import time
+from collections import deque
+
+import log
+from limiter import UpstreamUnavailable
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(UpstreamUnavailable):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        failure_rate_threshold: float = 0.5,
+        minimum_calls: int = 10,
+        window_seconds: float = 30.0,
+        open_seconds: float = 15.0,
+        half_open_max_calls: int = 2,
+    ):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.minimum_calls = minimum_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+
+        self.state = CLOSED
+        self._outcomes = deque()  # (timestamp, failed)
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+
+        self.rejected = 0
+        self.times_opened = 0
+
+    def before_call(self):
+        """
+        Raise CircuitOpen if the call must not reach the upstream.
+        Every call that passes must later be reported with record().
+        """
+        if self.state == OPEN:
+            remaining = self._opened_at + self.open_seconds - time.monotonic()
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpen(self.name, f"{self.name} circuit open", max(1, math.ceil(remaining)))
+            self.state = HALF_OPEN
+            self._probes = 0
+            self._probe_successes = 0
+
+        if self.state == HALF_OPEN:
+            if self._probes >= self.half_open_max_calls:
+                self.rejected += 1
+                raise CircuitOpen(self.name, f"{self.name} circuit half-open, probe in progress", 1)
+            self._probes += 1
+
+    def record(self, healthy: bool = None):
+        """
+        Report the outcome of a call admitted by before_call().
+        healthy=None (e.g. a cancelled hedge) only frees a half-open probe slot.
+        """
+        if self.state == HALF_OPEN:
+            if healthy is None:
+                self._probes -= 1
+            elif not healthy:
+                self._open()
+            else:
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_max_calls:
+                    self._close()
+            return
+
+        if healthy is None or self.state != CLOSED:
+            return
+
+        now = time.monotonic()
+        self._outcomes.append((now, not healthy))
+        self._failures += not healthy
+        while self._outcomes and self._outcomes[0][0] < now - self.window_seconds:
+            _, failed = self._outcomes.popleft()
+            self._failures -= failed
+
+        calls = len(self._outcomes)
+        if calls >= self.minimum_calls and self._failures / calls >= self.failure_rate_threshold:
+            self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self.times_opened += 1
+        log.warning("breaker.opened", upstream=self.name, timesOpened=self.times_opened)
+
+    def _close(self):
+        self.state = CLOSED
+        self._outcomes.clear()
+        self._failures = 0
+        log.info("breaker.closed", upstream=self.name)
+
+    def stats(self) -> dict:
+        calls = len(self._outcomes)
+        return {
+            "state": self.state,
+            "window_calls": calls,
+            "window_failure_rate": round(self._failures / calls, 3) if calls else 0.0,
+            "rejected": self.rejected,
+            "times_opened": self.times_opened,
+        }
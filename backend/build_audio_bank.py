@@ -0,0 +1,53 @@
+"""
+Build the pre-synthesized audio bank (offline step)
+Renders every fixed reply and the greeting for each TTS voice, in every audio
+format clients can negotiate, through the normal synthesis path and writes them into one pack that the server loads at startup.
+Re-run after changing FIXED_REPLIES, GREETINGS or the voice map.
+
+Usage: python build_audio_bank.py [output path]
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import upstream
+from audio_bank import GREETINGS, write_pack
+from main import (
+    AUDIO_FORMATS, FIXED_REPLIES, TTS_CHUNK_CONCURRENCY, TTS_VOICE_NAMES, audio_bank,
+    clean_text_for_tts, synthesize_chunk, tts_voice_config,
+)
+
+
+def bank_phrases():
+    for languageCode in TTS_VOICE_NAMES:
+        for audio_format in AUDIO_FORMATS:
+            for phrase, text in FIXED_REPLIES.items():
+                yield phrase, languageCode, text, audio_format
+            if languageCode in GREETINGS:
+                yield "greeting", languageCode, GREETINGS[languageCode], audio_format
+
+
+async def build(path: Path):
+    semaphore = asyncio.Semaphore(TTS_CHUNK_CONCURRENCY)
+
+    async def render(phrase: str, languageCode: str, text: str, audio_format: str):
+        async with semaphore:
+            audio_key, audio_bytes = await synthesize_chunk(
+                clean_text_for_tts(text), languageCode, tts_voice_config(languageCode), audio_format
+            )
+        print(f"🎙️ {languageCode} {phrase} ({audio_format}): {len(audio_bytes)} bytes")
+        meta = {"key": audio_key, "phrase": phrase, "languageCode": languageCode, "format": audio_format, "text": text}
+        return meta, audio_bytes
+
+    await upstream.pool.start()
+    try:
+        entries = await asyncio.gather(*(render(*item) for item in bank_phrases()))
+    finally:
+        await upstream.pool.aclose()
+    write_pack(path, entries)
+    print(f"✅ Wrote {len(entries)} clips, {path.stat().st_size} bytes, to {path}")
+
+
+if __name__ == "__main__":
+    asyncio.run(build(Path(sys.argv[1]) if len(sys.argv) > 1 else audio_bank.path))
@@ -0,0 +1,272 @@
+"""
+Response caches.
+
+LRUCache bounds memory by the accounted byte size of its entries rather than by
+entry count, and expires entries after a per-entry TTL. DiskCache is a size-capped,
+content-addressed file store, and TieredCache puts an LRUCache hot tier in front of it.
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+import threading
+import time
+import unicodedata
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+import log
+
+# Base directory for on-disk cache tiers
+CACHE_DIR = Path(os.getenv("HASIRI_CACHE_DIR", Path(__file__).parent / ".cache"))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(text: str) -> str:
+    """
+    Canonical form of a farmer's question for exact-match caching: NFKC
+    normalization, case folding, and punctuation/symbols folded into single spaces.
+    Combining marks are kept, so Indic vowel signs and viramas still distinguish words.
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = "".join(
+        " " if unicodedata.category(char)[0] in ("P", "S") else char
+        for char in text
+    )
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def hash_key(*parts: str) -> str:
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    def __init__(self, name: str, max_bytes: int, ttl: float = None):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (value, size, expires_at)
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and (entry[2] is None or entry[2] > time.monotonic())
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, size, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value, size: int, ttl: float = None):
+        """
+        Store value under key. size is the accounted byte size of the entry;
+        entries larger than the whole cache are not stored.
+        """
+        size += len(key)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        self._entries[key] = (value, size, expires_at)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def pop(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._remove(key)
+        return entry[0]
+
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+class DiskCache:
+    """
+    Content-addressed byte store on disk with a total size cap and LRU eviction.
+    Files live at <directory>/<key[:2]>/<key><suffix>; recency is tracked in memory
+    and seeded from file mtimes when the index is loaded at startup.
+    All methods block on file I/O; call them through asyncio.to_thread. They may run
+    on several worker threads at once: the index and byte count are only changed
+    under a lock, and file reads and writes happen outside it.
+    """
+
+    def __init__(self, name: str, directory: Path, max_bytes: int, suffix: str = ".bin"):
+        self.name = name
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._index = OrderedDict()  # key -> size, least recently used first
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}{self.suffix}"
+
+    def load(self):
+        if not self.directory.exists():
+            return
+        files = []
+        for path in self.directory.glob(f"*/*{self.suffix}"):
+            stat = path.stat()
+            files.append((stat.st_mtime, path.stem, stat.st_size))
+        with self._lock:
+            for _, key, size in sorted(files):
+                self._index[key] = size
+                self._bytes += size
+            victims = self._evict()
+        self._unlink(victims)
+        log.info("cache.disk_loaded", cache=self.name, files=len(self._index), bytes=self._bytes)
+
+    def get(self, key: str):
+        with self._lock:
+            if key not in self._index:
+                self.misses += 1
+                return None
+        try:
+            data = self._path(key).read_bytes()
+        except OSError:
+            # Evicted by another thread meanwhile, or removed from disk
+            with self._lock:
+                self._bytes -= self._index.pop(key, 0)
+                self.misses += 1
+            return None
+        with self._lock:
+            if key in self._index:
+                self._index.move_to_end(key)
+            self.hits += 1
+        return data
+
+    def touch(self, key: str):
+        # Recency bump for hits served by a faster tier; no file I/O
+        with self._lock:
+            if key in self._index:
+                self._index.move_to_end(key)
+
+    def set(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Concurrent writers of the same key each get their own temporary file
+        tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._bytes -= self._index.pop(key, 0)
+            self._index[key] = len(data)
+            self._bytes += len(data)
+            victims = self._evict()
+        self._unlink(victims)
+
+    def _evict(self) -> list:
+        """
+        Drop least recently used entries from the index until it fits; call with
+        the lock held. Returns the evicted keys, whose files the caller unlinks.
+        """
+        victims = []
+        while self._bytes > self.max_bytes and self._index:
+            key, size = self._index.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            victims.append(key)
+        return victims
+
+    def _unlink(self, keys: list):
+        for key in keys:
+            with self._lock:
+                if key in self._index:
+                    continue  # Stored again since it was evicted
+            try:
+                self._path(key).unlink()
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "files": len(self._index),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+class TieredCache:
+    """
+    Byte cache with an in-memory hot tier in front of a DiskCache.
+    Disk hits are promoted into the hot tier.
+    """
+
+    def __init__(self, name: str, directory: Path, max_disk_bytes: int, max_memory_bytes: int, suffix: str = ".bin"):
+        self.name = name
+        self.memory = LRUCache(name, max_memory_bytes)
+        self.disk = DiskCache(name, directory, max_disk_bytes, suffix)
+
+    async def load(self):
+        await asyncio.to_thread(self.disk.load)
+
+    async def get(self, key: str):
+        data = self.memory.get(key)
+        if data is not None:
+            self.disk.touch(key)
+            return data
+        data = await asyncio.to_thread(self.disk.get, key)
+        if data is not None:
+            self.memory.set(key, data, len(data))
+        return data
+
+    async def set(self, key: str, data: bytes):
+        if key in self.memory:
+            # Content-addressed: same key, same bytes, already stored
+            return
+        self.memory.set(key, data, len(data))
+        await asyncio.to_thread(self.disk.set, key, data)
+
+    def stats(self) -> dict:
+        return {"memory": self.memory.stats(), "disk": self.disk.stats()}
@@ -0,0 +1,147 @@
+"""
+Adaptive (AIMD) concurrency limiter with a bounded wait queue for upstream calls.
+
+The in-flight limit grows by roughly one slot per limit's worth of healthy responses
+and is cut multiplicatively on 429/5xx responses, transport errors, or when latency
+climbs well above its long-run average. Callers that cannot get a slot wait in a
+bounded FIFO queue; once the queue is full they are rejected immediately so the API
+can answer 503 with Retry-After instead of piling up.
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+
+
+class UpstreamUnavailable(Exception):
+    """
+    Raised when an upstream call is refused locally without contacting Google.
+    retry_after is the suggested client back-off in whole seconds.
+    """
+
+    def __init__(self, upstream: str, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class UpstreamOverloaded(UpstreamUnavailable):
+    pass
+
+
+class AdaptiveLimiter:
+    def __init__(
+        self,
+        name: str,
+        initial_limit: int = 10,
+        min_limit: int = 1,
+        max_limit: int = 100,
+        max_queue: int = 50,
+        queue_timeout: float = 10.0,
+        backoff_ratio: float = 0.7,
+        latency_tolerance: float = 2.0,
+    ):
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.backoff_ratio = backoff_ratio
+        self.latency_tolerance = latency_tolerance
+
+        self._in_flight = 0
+        self._waiters = deque()
+        self._latency_ewma = None
+        self._last_decrease = 0.0
+
+        self.rejected = 0
+        self.timed_out = 0
+        self.decreases = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        # A queued caller waits roughly one upstream round trip per queue "generation"
+        latency = self._latency_ewma or 1.0
+        return max(1, math.ceil(latency))
+
+    async def acquire(self):
+        if self._in_flight < int(self.limit) and not self._waiters:
+            self._in_flight += 1
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise UpstreamOverloaded(self.name, f"{self.name} queue full", self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+            if future.done() and not future.cancelled():
+                # The slot was handed to us just as we gave up, pass it on
+                self._in_flight -= 1
+                self._wake()
+            else:
+                try:
+                    self._waiters.remove(future)
+                except ValueError:
+                    pass
+            if isinstance(exc, asyncio.TimeoutError):
+                self.timed_out += 1
+                raise UpstreamOverloaded(self.name, f"{self.name} queue wait timed out", self.retry_after())
+            raise
+
+    def release(self, latency: float, healthy: bool = None):
+        """
+        Return a slot. healthy=True/False feeds the AIMD controller,
+        None (e.g. a cancelled call) releases the slot without a signal.
+        """
+        self._in_flight -= 1
+        if healthy is not None:
+            self._update(latency, healthy)
+        self._wake()
+
+    def _update(self, latency: float, healthy: bool):
+        if healthy and self._latency_ewma is not None:
+            healthy = latency <= self._latency_ewma * self.latency_tolerance
+        self._latency_ewma = latency if self._latency_ewma is None else 0.9 * self._latency_ewma + 0.1 * latency
+        if healthy:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            return
+
+        # Decrease at most once per round trip so one burst of failures is one signal
+        now = time.monotonic()
+        if now - self._last_decrease < (self._latency_ewma or 0.0):
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+        self.decreases += 1
+
+    def _wake(self):
+        while self._waiters and self._in_flight < int(self.limit):
+            future = self._waiters.popleft()
+            if not future.done():
+                self._in_flight += 1
+                future.set_result(None)
+
+    def stats(self) -> dict:
+        return {
+            "limit": int(self.limit),
+            "in_flight": self._in_flight,
+            "queued": len(self._waiters),
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+            "queue_timeouts": self.timed_out,
+            "limit_decreases": self.decreases,
+            "latency_ewma_ms": round(self._latency_ewma * 1000) if self._latency_ewma else None,
+        }
@@ -0,0 +1,196 @@
+"""
+Non-blocking structured logging for request hot paths.
+
+log.info("stt.transcribed", chars=42) only builds a small dict and appends it to
+a bounded in-memory queue. A background thread serializes queued records as JSON
+lines and writes them in batches, so a slow terminal or log collector never
+stalls the event loop. When the queue is full, records are dropped (and counted)
+instead of waited for.
+
+Every record carries the correlation ID of the request it was logged from, taken
+from the X-Request-ID header or generated by CorrelationMiddleware and echoed back
+in the response. String fields are capped at HASIRI_LOG_FIELD_MAX characters.
+Verbose payloads such as full upstream responses go through log.payload(): they
+are serialized (and capped at HASIRI_LOG_PAYLOAD_MAX) only for the sampled
+HASIRI_LOG_PAYLOAD_SAMPLE fraction of requests, decided per request so a sampled
+request logs all of its payloads.
+"""
+
+import contextvars
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+import zlib
+from collections import deque
+
+import metrics
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+
+ENABLED = os.getenv("HASIRI_LOG", "1") == "1"
+LEVEL = LEVELS.get(os.getenv("HASIRI_LOG_LEVEL", "info").lower(), 20)
+FIELD_MAX = int(os.getenv("HASIRI_LOG_FIELD_MAX", "200"))
+PAYLOAD_MAX = int(os.getenv("HASIRI_LOG_PAYLOAD_MAX", "2000"))
+PAYLOAD_SAMPLE = float(os.getenv("HASIRI_LOG_PAYLOAD_SAMPLE", "0.01"))
+QUEUE_SIZE = int(os.getenv("HASIRI_LOG_QUEUE_SIZE", "10000"))
+FLUSH_INTERVAL = 0.05
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+
+def cap(value: str, limit: int) -> str:
+    if len(value) <= limit:
+        return value
+    return f"{value[:limit]}…(+{len(value) - limit} chars)"
+
+
+class LogPipeline:
+    def __init__(self, stream=None, queue_size: int = QUEUE_SIZE):
+        self.stream = stream
+        self.queue_size = queue_size
+        self._queue = deque()  # append/popleft are thread-safe
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.written = 0
+        self.dropped = 0
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        Write out everything queued and stop the writer thread.
+        """
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self._drain()
+
+    def emit(self, record: dict):
+        if len(self._queue) >= self.queue_size:
+            self.dropped += 1
+            return
+        self._queue.append(record)
+        if self._thread is None:
+            self.start()
+
+    def _run(self):
+        while not self._stop.wait(FLUSH_INTERVAL):
+            self._drain()
+
+    def _drain(self):
+        lines = []
+        while self._queue:
+            lines.append(self._format(self._queue.popleft()))
+        if lines:
+            stream = self.stream or sys.stdout
+            stream.write("\n".join(lines) + "\n")
+            stream.flush()
+            self.written += len(lines)
+
+    @staticmethod
+    def _format(record: dict) -> str:
+        record["ts"] = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record["ts"])) + f".{int(record['ts'] * 1000) % 1000:03d}Z"
+        payload = record.pop("payload", None)
+        if payload is not None:
+            record["payload"] = cap(json.dumps(payload, ensure_ascii=False, default=str), PAYLOAD_MAX)
+        return json.dumps(record, ensure_ascii=False, default=str)
+
+    def stats(self) -> dict:
+        return {"queued": len(self._queue), "written": self.written, "dropped": self.dropped}
+
+
+pipeline = LogPipeline()
+metrics.register_gauge("log", lambda: pipeline.stats())
+
+
+def _log(level: str, event: str, fields: dict, payload=None):
+    if not ENABLED or LEVELS[level] < LEVEL:
+        return
+    record = {"ts": time.time(), "level": level, "event": event, "requestId": request_id.get()}
+    for name, value in fields.items():
+        record[name] = cap(value, FIELD_MAX) if isinstance(value, str) else value
+    if payload is not None:
+        record["payload"] = payload
+    pipeline.emit(record)
+
+
+def debug(event: str, **fields):
+    _log("debug", event, fields)
+
+
+def info(event: str, **fields):
+    _log("info", event, fields)
+
+
+def warning(event: str, **fields):
+    _log("warning", event, fields)
+
+
+def error(event: str, **fields):
+    _log("error", event, fields)
+
+
+def sampled() -> bool:
+    """
+    Whether the current request logs verbose payloads.
+    """
+    rid = request_id.get()
+    if rid is None:
+        return random.random() < PAYLOAD_SAMPLE
+    return zlib.crc32(rid.encode("utf-8")) % 10000 < PAYLOAD_SAMPLE * 10000
+
+
+def payload(event: str, data, **fields):
+    """
+    Log a verbose payload (e.g. a full upstream response) for sampled requests only.
+    Serialization happens on the writer thread.
+    """
+    if not ENABLED or (LEVEL > LEVELS["debug"] and not sampled()):
+        return
+    _log("info", event, fields, payload=data)
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+class CorrelationMiddleware:
+    """
+    ASGI middleware giving every HTTP request and WebSocket a correlation ID:
+    the client's X-Request-ID when sent, otherwise a new one, echoed back in the
+    X-Request-ID response header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            return await self.app(scope, receive, send)
+        rid = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                rid = value.decode("latin-1")[:64]
+                break
+        rid = rid or new_request_id()
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (b"x-request-id", rid.encode("latin-1"))]
+            await send(message)
+
+        token = request_id.set(rid)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id.reset(token)
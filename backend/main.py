@@ -1,16 +1,35 @@
+import asyncio
 import os
 import sys
 import re
+from contextlib import asynccontextmanager
 from pathlib import Path
-from fastapi import FastAPI, UploadFile, File, Form
+from fastapi import FastAPI, Request, Response, UploadFile, File, Form, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from dotenv import load_dotenv
-import requests
+import httpx
 from PIL import Image
 import io
 import base64
+import hashlib
+import json
 import logging
+import time
+import uuid
+
+import metrics
+import upstream
+import segmenter
+import speech_audio
+import streaming_stt
+import uploads
+import log
+import semantic_cache
+from singleflight import SingleFlight
+from tts_text import clean_text_for_tts
+from audio_bank import GREETINGS, AudioBank
+from cache import CACHE_DIR, LRUCache, TieredCache, hash_key, normalize_question
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -32,6 +51,83 @@ else:
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 GOOGLE_SPEECH_API_KEY = os.getenv("GOOGLE_SPEECH_API_KEY")
 GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-pro:generateContent"
+GEMINI_STREAM_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-pro:streamGenerateContent"
+
+# Optional hedged Gemini requests for short /chat questions (costs extra upstream calls)
+CHAT_HEDGING = os.getenv("HASIRI_CHAT_HEDGING", "0") == "1"
+CHAT_HEDGE_MAX_CHARS = int(os.getenv("HASIRI_CHAT_HEDGE_MAX_CHARS", "300"))
+
+# Replies used when Gemini cannot answer; pre-rendered for every voice in the audio bank
+FIXED_REPLIES = {
+    "chat_error": "Sorry, I couldn't process your request. Please try again.",
+    "chat_trouble": "I'm having trouble right now. Please try again in a moment.",
+    "image_error": "Sorry, I couldn't analyze this image. Please try with a clearer crop image.",
+    "image_trouble": "I'm having trouble analyzing this image. Please try again with a different image.",
+}
+
+# Map language codes to language names for better AI understanding
+LANGUAGE_NAMES = {
+    "ta": "Tamil",
+    "hi": "Hindi",
+    "te": "Telugu",
+    "kn": "Kannada",
+    "ml": "Malayalam",
+    "bn": "Bengali",
+    "gu": "Gujarati",
+    "pa": "Punjabi",
+    "mr": "Marathi",
+    "en": "English"
+}
+
+# Exact-match cache of Gemini chat replies keyed on normalized question + language
+chat_cache = LRUCache(
+    "chat",
+    max_bytes=int(os.getenv("HASIRI_CHAT_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+    ttl=float(os.getenv("HASIRI_CHAT_CACHE_TTL", str(6 * 3600)))
+)
+metrics.register_gauge("cache.chat", chat_cache.stats)
+
+# Near-duplicate question cache (local n-gram TF-IDF vectors), persisted across restarts.
+# Off by default: similar wording can still be a different question, so hits are also
+# checked for matching numbers and negations. Only the LANGUAGE_NAMES languages are cached.
+SEMANTIC_CACHE_ENABLED = os.getenv("HASIRI_SEMANTIC_CACHE", "0") == "1"
+semantic_chat_cache = semantic_cache.from_env(CACHE_DIR, LANGUAGE_NAMES)
+if SEMANTIC_CACHE_ENABLED:
+    metrics.register_gauge("cache.chat_semantic", semantic_chat_cache.stats)
+
+# Content-addressed cache for synthesized speech (MP3 and Opus; the key includes
+# the encoding, the .mp3 suffix predates Opus): memory hot tier + disk
+tts_cache = TieredCache(
+    "tts",
+    CACHE_DIR / "tts",
+    max_disk_bytes=int(os.getenv("HASIRI_TTS_CACHE_MAX_BYTES", str(512 * 1024 * 1024))),
+    max_memory_bytes=int(os.getenv("HASIRI_TTS_CACHE_MEMORY_BYTES", str(32 * 1024 * 1024))),
+    suffix=".mp3"
+)
+metrics.register_gauge("cache.tts", tts_cache.stats)
+
+# Speech-to-text results keyed on the uploaded audio bytes + recognition settings,
+# so a client re-sending a recording after a dropped response is answered locally
+stt_cache = TieredCache(
+    "stt",
+    CACHE_DIR / "stt",
+    max_disk_bytes=int(os.getenv("HASIRI_STT_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    max_memory_bytes=int(os.getenv("HASIRI_STT_CACHE_MEMORY_BYTES", str(4 * 1024 * 1024))),
+    suffix=".json"
+)
+metrics.register_gauge("cache.stt", stt_cache.stats)
+
+# Fixed replies and greetings pre-synthesized offline by build_audio_bank.py
+audio_bank = AudioBank(Path(os.getenv("HASIRI_AUDIO_BANK", Path(__file__).parent / "audio_bank.pack")))
+metrics.register_gauge("audio_bank", audio_bank.stats)
+
+# Identical concurrent upstream requests share one in-flight call
+chat_flight = SingleFlight("chat")
+tts_flight = SingleFlight("tts")
+image_flight = SingleFlight("image")
+stt_flight = SingleFlight("stt")
+for _flight in (chat_flight, tts_flight, image_flight, stt_flight):
+    metrics.register_gauge(f"singleflight.{_flight.name}", _flight.stats)
 
 if GOOGLE_SPEECH_API_KEY:
     print(f"🔑 Google Speech API Key loaded: {GOOGLE_SPEECH_API_KEY[:15]}...")
@@ -50,10 +146,33 @@ if not GOOGLE_SPEECH_API_KEY or not GEMINI_API_KEY:
     print("GEMINI_API_KEY=your_key_here")
     raise ValueError("Missing required API keys in .env file")
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    log.pipeline.start()
+    # One pooled async client per upstream for the whole application lifetime
+    await upstream.pool.start()
+    await tts_cache.load()
+    await stt_cache.load()
+    await asyncio.to_thread(audio_bank.load)
+    if not speech_audio.FFMPEG:
+        # Uploads other than WAV are then not silence-trimmed or split when long, and
+        # formats the Speech API cannot take (M4A, AAC, MP3, multi-channel non-WAV) are rejected
+        log.warning("stt.ffmpeg_missing")
+    if SEMANTIC_CACHE_ENABLED:
+        await asyncio.to_thread(semantic_chat_cache.load)
+    try:
+        yield
+    finally:
+        await upstream.pool.aclose()
+        if SEMANTIC_CACHE_ENABLED:
+            await asyncio.to_thread(semantic_chat_cache.save)
+        await asyncio.to_thread(log.pipeline.stop)
+
 app = FastAPI(
     title="HASIRI Agricultural Assistant API",
     description="AI-powered agricultural assistant for farmers with automatic language detection",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS for Flutter web/app deployment
@@ -65,66 +184,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-def clean_text_for_tts(text: str) -> str:
-    """
-    Clean text for Text-to-Speech to avoid pronunciation of symbols and formatting.
-    Removes markdown formatting, bullet points, and other symbols that TTS might pronounce.
-    """
-    if not text:
-        return ""
-    
-    # Remove markdown formatting
-    text = re.sub(r'\*\*([^*]+)\*\*', r'\1', text)  # Bold **text**
-    text = re.sub(r'\*([^*]+)\*', r'\1', text)      # Italic *text*
-    text = re.sub(r'__([^_]+)__', r'\1', text)      # Bold __text__
-    text = re.sub(r'_([^_]+)_', r'\1', text)        # Italic _text_
-    text = re.sub(r'`([^`]+)`', r'\1', text)        # Code `text`
-    text = re.sub(r'```[^`]*```', '', text)         # Code blocks
-    
-    # Remove bullet points and list markers
-    text = re.sub(r'^[\s]*[•·▪▫‣⁃]\s*', '', text, flags=re.MULTILINE)  # Unicode bullets
-    text = re.sub(r'^[\s]*[-*+]\s*', '', text, flags=re.MULTILINE)     # ASCII bullets
-    text = re.sub(r'^[\s]*\d+\.\s*', '', text, flags=re.MULTILINE)     # Numbered lists
-    
-    # Remove headers
-    text = re.sub(r'^#+\s*', '', text, flags=re.MULTILINE)             # Markdown headers
-    
-    # Remove links
-    text = re.sub(r'\[([^\]]+)\]\([^)]+\)', r'\1', text)               # [text](url)
-    text = re.sub(r'https?://[^\s]+', '', text)                        # Raw URLs
-    
-    # Remove common symbols that might be pronounced
-    text = re.sub(r'[#@$%^&*(){}[\]|\\<>]', '', text)                  # Special characters
-    text = re.sub(r'[→←↑↓⟹⟸⟷]', '', text)                             # Arrow symbols
-    text = re.sub(r'[✓✗✘✔✕]', '', text)                                # Check marks
-    text = re.sub(r'[©®™]', '', text)                                   # Copyright symbols
-    text = re.sub(r'[°℃℉]', ' degrees ', text)                         # Temperature symbols
-    text = re.sub(r'[₹$£€¥]', '', text)                                 # Currency symbols
-    
-    # Clean up excessive punctuation
-    text = re.sub(r'[.]{2,}', '.', text)                               # Multiple dots
-    text = re.sub(r'[-]{2,}', '-', text)                               # Multiple dashes
-    text = re.sub(r'[!]{2,}', '!', text)                               # Multiple exclamations
-    text = re.sub(r'[?]{2,}', '?', text)                               # Multiple questions
-    
-    # Replace common separators with natural pauses
-    text = re.sub(r'[-–—]', ', ', text)                                 # Dashes to commas
-    text = re.sub(r'[|]', ', ', text)                                   # Pipes to commas
-    text = re.sub(r'[/]', ' or ', text)                                 # Slashes to "or"
-    
-    # Handle common abbreviations that might be mispronounced
-    text = re.sub(r'\b(etc\.?)\b', 'and so on', text, flags=re.IGNORECASE)
-    text = re.sub(r'\b(i\.e\.?)\b', 'that is', text, flags=re.IGNORECASE)
-    text = re.sub(r'\b(e\.g\.?)\b', 'for example', text, flags=re.IGNORECASE)
-    text = re.sub(r'\b(vs\.?)\b', 'versus', text, flags=re.IGNORECASE)
-    
-    # Clean up whitespace
-    text = re.sub(r'\s+', ' ', text)                                    # Multiple spaces
-    text = re.sub(r'\n\s*\n', '\n', text)                              # Multiple newlines
-    text = text.strip()                                                 # Leading/trailing spaces
-    
-    return text
-
 def detect_language_from_text(text: str) -> str:
     """
     Fallback function to detect language from text patterns when Speech API doesn't provide it.
@@ -198,6 +257,17 @@ def detect_language_from_text(text: str) -> str:
     
     # Default to English
     return "en-US"
+# Refuse oversized uploads before their bodies are received and spooled
+app.add_middleware(
+    uploads.UploadLimitMiddleware,
+    limits={
+        "/speech-to-text": uploads.MAX_AUDIO_BYTES + uploads.FORM_OVERHEAD_BYTES,
+        "/voice-turn": uploads.MAX_AUDIO_BYTES + uploads.FORM_OVERHEAD_BYTES,
+        "/voice-turn/stream": uploads.MAX_AUDIO_BYTES + uploads.FORM_OVERHEAD_BYTES,
+        "/analyze-image": uploads.MAX_IMAGE_BYTES + uploads.FORM_OVERHEAD_BYTES,
+    },
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Change to your frontend URL in production
@@ -206,6 +276,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost: every request and WebSocket gets a correlation ID for structured logs
+app.add_middleware(log.CorrelationMiddleware)
+
+def service_unavailable(error: upstream.UpstreamUnavailable) -> JSONResponse:
+    """
+    503 response with Retry-After for upstream calls refused locally
+    (limiter queue full or circuit breaker open).
+    """
+    log.warning("upstream.unavailable", upstream=error.upstream, error=str(error), retryAfter=error.retry_after)
+    return JSONResponse(
+        status_code=503,
+        content={"error": str(error), "retryAfter": error.retry_after},
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
 # Root endpoint for health check - support both GET and HEAD
 @app.get("/")
 @app.head("/")
@@ -217,9 +302,18 @@ async def root():
         "features": ["automatic language detection", "native speaker responses"],
         "endpoints": [
             "/chat",
-            "/speech-to-text", 
+            "/chat/stream",
+            "/speech-to-text",
+            "/speech-to-text/stream",
             "/text-to-speech",
-            "/analyze-image"
+            "/text-to-speech/stream",
+            "/text-to-speech/audio/{audio_key}",
+            "/text-to-speech/phrase/{phrase}",
+            "/voice-turn",
+            "/voice-turn/stream",
+            "/analyze-image",
+            "/health",
+            "/metrics"
         ]
     }
 
@@ -228,6 +322,11 @@ async def root():
 async def health_check():
     return {"status": "healthy", "timestamp": "2025-07-27"}
 
+# Upstream limiter, cache and traffic metrics
+@app.get("/metrics")
+async def get_metrics():
+    return metrics.snapshot()
+
 # Test endpoint for debugging connections
 @app.get("/test")
 async def test_connection():
@@ -248,285 +347,1250 @@ async def test_post(message: str = Form("Hello from frontend!")):
         "status": "working"
     }
 
-# Speech-to-Text endpoint with automatic language detection
-@app.post("/speech-to-text")
-async def speech_to_text(audio: UploadFile = File(...)):
-    try:
-        print(f"🎤 Processing speech-to-text for file: {audio.filename}")
-        audio_bytes = await audio.read()
+STT_URL = "https://speech.googleapis.com/v1/speech:recognize"
+
+# Trim silence (and skip silent clips) before uploading to the Speech API
+STT_VAD = os.getenv("HASIRI_STT_VAD", "1") == "1"
+
+# speech:recognize accepts at most about a minute of audio per call; longer recordings
+# are cut at pauses into overlapping segments recognized concurrently
+STT_MAX_SEGMENT_SECONDS = float(os.getenv("HASIRI_STT_MAX_SEGMENT_SECONDS", "55"))
+STT_SEGMENT_OVERLAP_SECONDS = float(os.getenv("HASIRI_STT_SEGMENT_OVERLAP_SECONDS", "1.0"))
+STT_SEGMENT_CONCURRENCY = int(os.getenv("HASIRI_STT_SEGMENT_CONCURRENCY", "4"))
+
+def stt_config(encoding: str = "WEBM_OPUS", sample_rate: int = 48000) -> dict:
+    """
+    Recognition config with automatic language detection across the supported languages.
+    """
+    return {
+        "encoding": encoding,  # WEBM_OPUS from web audio by default
+        "sampleRateHertz": sample_rate,
+        "languageCode": "en-US",  # Primary language hint
+        "alternativeLanguageCodes": [
+            "ta-IN",    # Tamil
+            "hi-IN",    # Hindi  
+            "te-IN",    # Telugu
+            "kn-IN",    # Kannada
+            "ml-IN",    # Malayalam
+            "bn-IN",    # Bengali
+            "gu-IN",    # Gujarati
+            "pa-IN",    # Punjabi
+            "mr-IN"     # Marathi
+        ],
+        "enableAutomaticPunctuation": True,
+        "enableWordConfidence": True,
+        "enableSpokenPunctuation": True,
+        "enableWordTimeOffsets": True,
+        "audioChannelCount": 1,
+        "model": "latest_long"
+    }
+
+def parse_stt_result(result: dict) -> tuple:
+    """
+    Returns (transcript, detected languageCode) from a speech:recognize response.
+    """
+    transcript = ""
+    detected_language = "en-US"  # Default fallback
+    
+    if "results" in result and result["results"]:
+        # Get the best alternative from results
+        best_result = result["results"][0]
+        alt = best_result["alternatives"][0]
+        transcript = alt["transcript"]
         
-        headers = {"Content-Type": "application/json"}
-        stt_url = f"https://speech.googleapis.com/v1/speech:recognize?key={GOOGLE_SPEECH_API_KEY}"
+        # Try multiple ways to get detected language from Google Speech API
+        detected_language = None
         
-        # Enhanced configuration for automatic language detection
-        data = {
-            "config": {
-                "encoding": "WEBM_OPUS",  # Updated for web audio
-                "sampleRateHertz": 48000,  # Updated sample rate for web audio
-                "languageCode": "en-US",  # Primary language hint
-                "alternativeLanguageCodes": [
-                    "ta-IN",    # Tamil
-                    "hi-IN",    # Hindi  
-                    "te-IN",    # Telugu
-                    "kn-IN",    # Kannada
-                    "ml-IN",    # Malayalam
-                    "bn-IN",    # Bengali
-                    "gu-IN",    # Gujarati
-                    "pa-IN",    # Punjabi
-                    "mr-IN"     # Marathi
-                ],
-                "enableAutomaticPunctuation": True,
-                "enableWordConfidence": True,
-                "enableSpokenPunctuation": True,
-                "enableWordTimeOffsets": True,
-                "audioChannelCount": 1,
-                "model": "latest_long"
-            },
-            "audio": {
-                "content": base64.b64encode(audio_bytes).decode("utf-8")
-            }
-        }
+        # Method 1: Check if language_code is in the result metadata
+        if "languageCode" in best_result:
+            detected_language = best_result["languageCode"]
+            log.debug("stt.language", source="result", languageCode=detected_language)
         
-        response = requests.post(stt_url, headers=headers, json=data)
-        print(f"🔍 Speech API response status: {response.status_code}")
+        # Method 2: Check alternative's language_code
+        elif "languageCode" in alt:
+            detected_language = alt["languageCode"]
+            log.debug("stt.language", source="alternative", languageCode=detected_language)
         
-        # Debug: Print the full response to understand the structure
-        if response.ok:
-            result = response.json()
-            print(f"🔍 Full Speech API response: {result}")
-        else:
-            print(f"❌ Speech API error response: {response.text}")
+        # Method 3: Check if it's in the response root
+        elif "languageCode" in result:
+            detected_language = result["languageCode"]
+            log.debug("stt.language", source="response", languageCode=detected_language)
         
-        if response.ok:
-            result = response.json()
-            transcript = ""
-            detected_language = "en-US"  # Default fallback
-            
-            if "results" in result and result["results"]:
-                # Get the best alternative from results
-                best_result = result["results"][0]
-                alt = best_result["alternatives"][0]
-                transcript = alt["transcript"]
-                
-                # Try multiple ways to get detected language from Google Speech API
-                detected_language = None
-                
-                # Method 1: Check if language_code is in the result metadata
-                if "languageCode" in best_result:
-                    detected_language = best_result["languageCode"]
-                    print(f"🌐 Language detected from result metadata: {detected_language}")
-                
-                # Method 2: Check alternative's language_code
-                elif "languageCode" in alt:
-                    detected_language = alt["languageCode"]
-                    print(f"🌐 Language detected from alternative: {detected_language}")
-                
-                # Method 3: Check if it's in the response root
-                elif "languageCode" in result:
-                    detected_language = result["languageCode"]
-                    print(f"🌐 Language detected from response root: {detected_language}")
-                
-                # If Google Speech API didn't return language, use our text-based detection
-                if not detected_language:
-                    detected_language = detect_language_from_text(transcript)
-                    print(f"🧠 Using text-based language detection: {detected_language}")
-                else:
-                    print(f"🌐 Google Speech API detected language: {detected_language}")
-                
-                print(f"✅ Transcription successful: {transcript[:50]}...")
-                print(f"🌐 Final detected language: {detected_language}")
-            else:
-                print("⚠️ No speech detected in audio")
-                # Still try to detect language from any available text
-                if transcript:
-                    detected_language = detect_language_from_text(transcript)
-            
-            return {
-                "transcript": transcript, 
-                "languageCode": detected_language,
-                "language_code": detected_language  # Also include this for frontend compatibility
-            }
-        else:
-            print(f"❌ Speech API error: {response.text}")
-            return {"error": response.text}
+        # If Google Speech API didn't return language, use our text-based detection
+        if not detected_language:
+            detected_language = detect_language_from_text(transcript)
+            log.debug("stt.language", source="text", languageCode=detected_language)
+        
+        log.info("stt.transcribed", transcript=transcript[:50], languageCode=detected_language)
+    else:
+        log.info("stt.no_speech")
+    
+    return transcript, detected_language
+
+def canonical_language_code(languageCode: str) -> str:
+    """
+    The Speech API reports detected languages in lower case ("ta-in"); map them
+    back to the codes used everywhere else ("ta-IN"), e.g. for TTS voice lookup.
+    """
+    config = stt_config()
+    for code in [config["languageCode"], *config["alternativeLanguageCodes"]]:
+        if code.lower() == languageCode.lower():
+            return code
+    return languageCode
+
+def parse_stt_duration(value) -> float:
+    """
+    Seconds from a protobuf Duration as JSON ("1.300s"), or 0.0.
+    """
+    try:
+        return float(str(value).rstrip("s"))
+    except ValueError:
+        return 0.0
+
+def parse_stt_words(result: dict) -> list:
+    """
+    (start seconds, word, languageCode, confidence) for every word of every result
+    in a speech:recognize response, using the word time offsets.
+    """
+    words = []
+    for item in result.get("results", []):
+        if not item.get("alternatives"):
+            continue
+        alt = item["alternatives"][0]
+        languageCode = item.get("languageCode") or alt.get("languageCode")
+        for word in alt.get("words", []):
+            words.append((
+                parse_stt_duration(word.get("startTime", "0s")), word["word"], languageCode, word.get("confidence")
+            ))
+    return words
+
+async def recognize_speech_result(audio_bytes: bytes, config: dict) -> dict:
+    """
+    One speech:recognize call, returning the raw response.
+    Raises httpx.HTTPStatusError on an upstream error.
+    """
+    data = {
+        "config": config,
+        "audio": {
+            "content": uploads.BASE64_PLACEHOLDER
+        }
+    }
+    body, _ = await uploads.base64_json_body(data, audio_bytes)
+    params = {"key": GOOGLE_SPEECH_API_KEY}
+    response = await upstream.post("speech", STT_URL, params=params, content=body)
+    log.debug("stt.upstream_status", status=response.status_code)
+    if not response.is_success:
+        log.error("stt.upstream_error", status=response.status_code, body=response.text)
+        response.raise_for_status()
+    result = response.json()
+    log.payload("stt.upstream_response", result)
+    return result
+
+async def recognize_speech(audio_bytes: bytes, config: dict) -> tuple:
+    """
+    One speech:recognize call. Returns (transcript, detected languageCode).
+    Raises httpx.HTTPStatusError on an upstream error.
+    """
+    return parse_stt_result(await recognize_speech_result(audio_bytes, config))
+
+async def recognize_long_speech(samples, sample_rate: int) -> tuple:
+    """
+    Recognize a recording longer than one recognize call allows: split it at pauses
+    into overlapping segments, recognize them concurrently, and stitch the words back
+    together by their time offsets. The language is the one most words were
+    recognized in, so one segment misdetected as English does not decide it.
+    Returns (transcript, languageCode, words as (word, languageCode, confidence)).
+    """
+    segments = speech_audio.split_segments(
+        samples, sample_rate, STT_MAX_SEGMENT_SECONDS, STT_SEGMENT_OVERLAP_SECONDS
+    )
+    log.info("stt.long_audio", seconds=round(len(samples) / sample_rate, 1), segments=len(segments))
+    semaphore = asyncio.Semaphore(STT_SEGMENT_CONCURRENCY)
+    config = stt_config("LINEAR16", sample_rate)
+
+    async def recognize(segment):
+        pcm = samples[segment.start:segment.end].astype("<i2").tobytes()
+        async with semaphore:
+            result = await recognize_speech_result(pcm, config)
+        words = parse_stt_words(result)
+        if not words and result.get("results"):
+            # No word offsets: keep the segment's transcript whole, placed inside its own span
+            transcript, languageCode = parse_stt_result(result)
+            words = [(segment.keep_start - segment.offset, transcript, languageCode, None)]
+        return [(start, (word, languageCode, confidence)) for start, word, languageCode, confidence in words]
+
+    segment_words = await asyncio.gather(*(recognize(segment) for segment in segments))
+    words = speech_audio.stitch_words(segments, segment_words)
+    transcript = " ".join(word for word, _, _ in words)
+
+    votes = {}
+    for _, languageCode, _ in words:
+        if languageCode:
+            languageCode = canonical_language_code(languageCode)
+            votes[languageCode] = votes.get(languageCode, 0) + 1
+    if votes:
+        detected_language = max(votes, key=votes.get)
+    else:
+        detected_language = detect_language_from_text(transcript) if transcript else "en-US"
+    log.info("stt.languages_reconciled", votes=votes, languageCode=detected_language)
+    log.info("stt.transcribed", transcript=transcript[:50], languageCode=detected_language, words=len(words))
+    return transcript, detected_language, words
+
+# Speech-to-Text endpoint with automatic language detection
+def stt_cache_key(audio_bytes: bytes) -> str:
+    """
+    Cache key for a transcription: the raw upload plus every setting that shapes
+    the recognition (the base config, VAD, long-audio segmentation).
+    """
+    settings = json.dumps(
+        [stt_config(), STT_VAD, STT_MAX_SEGMENT_SECONDS, STT_SEGMENT_OVERLAP_SECONDS], sort_keys=True
+    )
+    return hash_key(hashlib.sha256(audio_bytes).hexdigest(), settings)
+
+async def transcribe_audio(audio_bytes: bytes) -> dict:
+    """
+    Recognize one upload. Returns {"transcript", "languageCode", "words",
+    "secondsSaved"}, or {"error"} when the audio is rejected locally.
+    """
+    prepared = await speech_audio.prepare_for_stt(audio_bytes, vad=STT_VAD)
+    if prepared.error:
+        # Unknown or undecodable audio would only fail upstream after a full round trip
+        metrics.incr("stt.rejected_audio")
+        log.warning("stt.rejected", error=prepared.error)
+        return {"error": prepared.error}
+    if prepared.seconds_saved:
+        metrics.observe("stt.vad_seconds_saved", prepared.seconds_saved)
+        log.info("stt.trimmed", secondsSaved=round(prepared.seconds_saved, 2))
+    if prepared.silent:
+        metrics.incr("stt.silent_clips")
+        log.info("stt.silent_clip")
+        return {"transcript": "", "languageCode": "en-US", "words": [], "secondsSaved": prepared.seconds_saved}
+    
+    if prepared.duration > STT_MAX_SEGMENT_SECONDS:
+        metrics.incr("stt.long_audio")
+        transcript, detected_language, words = await recognize_long_speech(prepared.samples, prepared.samples_rate)
+        words = [(word, confidence) for word, _, confidence in words]
+    else:
+        config = stt_config(prepared.encoding, prepared.sample_rate)
+        log.info("stt.recognize", bytes=len(prepared.audio_bytes), encoding=prepared.encoding, sampleRateHertz=prepared.sample_rate)
+        result = await recognize_speech_result(prepared.audio_bytes, config)
+        transcript, detected_language = parse_stt_result(result)
+        words = [(word, confidence) for _, word, _, confidence in parse_stt_words(result)]
+    return {
+        "transcript": transcript,
+        "languageCode": detected_language,
+        "words": [{"word": word, "confidence": confidence} for word, confidence in words],
+        "secondsSaved": prepared.seconds_saved,
+    }
+
+async def transcribe_cached(audio_bytes: bytes) -> dict:
+    """
+    transcribe_audio() behind the STT result cache and single-flight.
+    The disk tier is written from a worker thread; DiskCache serializes its index
+    updates, and only the flight leader stores the result.
+    """
+    cache_key = stt_cache_key(audio_bytes)
+    cached = await stt_cache.get(cache_key)
+    if cached is not None:
+        log.info("stt.cache_hit")
+        return json.loads(cached)
+
+    async def recognize_and_store() -> dict:
+        result = await transcribe_audio(audio_bytes)
+        if "error" not in result:
+            await stt_cache.set(cache_key, json.dumps(result, ensure_ascii=False).encode("utf-8"))
+        return result
+
+    # A retry arriving while the first attempt is still recognizing waits for it
+    return await stt_flight.do(cache_key, recognize_and_store)
+
+@app.post("/speech-to-text")
+async def speech_to_text(http_response: Response, audio: UploadFile = File(...)):
+    try:
+        log.info("stt.request", filename=audio.filename)
+        audio_bytes = await uploads.read_upload(audio, uploads.MAX_AUDIO_BYTES)
+        result = await transcribe_cached(audio_bytes)
+        if "error" in result:
+            return JSONResponse(status_code=415, content={"error": result["error"]})
+        if result["secondsSaved"]:
+            http_response.headers["X-Audio-Seconds-Saved"] = f"{result['secondsSaved']:.2f}"
+        return {
+            "transcript": result["transcript"], 
+            "languageCode": result["languageCode"],
+            "language_code": result["languageCode"],  # Also include this for frontend compatibility
+            "words": result["words"]
+        }
             
+    except uploads.UploadTooLarge as e:
+        log.warning("upload.too_large", size=e.size, maxBytes=e.max_bytes)
+        return JSONResponse(status_code=413, content={"error": str(e)})
+    except httpx.HTTPStatusError as e:
+        return {"error": e.response.text}
+    except upstream.UpstreamUnavailable as e:
+        return service_unavailable(e)
     except Exception as e:
-        print(f"❌ Speech-to-text error: {str(e)}")
+        log.error("stt.error", error=str(e))
         return {"error": f"Processing error: {str(e)}"}
 
+class RejectedAudio(Exception):
+    """
+    Streamed audio that transcribe_audio rejected locally (unknown or undecodable).
+    """
+
+async def recognize_stream_final(audio_bytes: bytes, config: dict) -> tuple:
+    """
+    Final transcript of a streamed recording through the same path as uploads
+    (container sniffing, VAD, STT cache). Raw samples get a WAV header first.
+    """
+    if config["encoding"] in streaming_stt.RAW_ENCODINGS:
+        audio_bytes = speech_audio.wrap_wav(audio_bytes, config["encoding"], config["sampleRateHertz"])
+    result = await transcribe_cached(audio_bytes)
+    if "error" in result:
+        raise RejectedAudio(result["error"])
+    return result["transcript"], result["languageCode"]
+
+stt_recognizer = streaming_stt.from_env(recognize_speech, recognize_stream_final)
+
+STREAM_ENCODINGS = {"WEBM_OPUS", "OGG_OPUS", "LINEAR16", "MULAW", "FLAC"}
+
+def stream_stt_config(query_params) -> dict:
+    """
+    Recognition config from the WebSocket query parameters; ValueError if unsupported.
+    """
+    encoding = query_params.get("encoding", "WEBM_OPUS")
+    if encoding not in STREAM_ENCODINGS:
+        raise ValueError(f"Unsupported encoding {encoding!r}; use one of {', '.join(sorted(STREAM_ENCODINGS))}")
+    sample_rate = query_params.get("sampleRateHertz", "48000")
+    if not sample_rate.isdigit() or not 8000 <= int(sample_rate) <= 48000:
+        raise ValueError(f"Invalid sampleRateHertz {sample_rate!r}; use 8000 to 48000")
+    return stt_config(encoding, int(sample_rate))
+
+# Streaming Speech-to-Text over a WebSocket
+# Query parameters: encoding (WEBM_OPUS, the default, OGG_OPUS, LINEAR16, MULAW or FLAC),
+# sampleRateHertz (8000-48000, default 48000).
+# The client sends audio as binary frames while recording, then the text message "end"
+# (or closes its side); at most uploads.MAX_AUDIO_BYTES in all. The server sends JSON messages:
+#   {"type": "interim", "transcript", "languageCode"} while audio is arriving,
+#   {"type": "final", "transcript", "languageCode", "language_code"} once at the end,
+#   {"type": "error", "error", "retryAfter"} if recognition fails, then closes the socket
+#   (1008 bad parameters, 1009 too much audio, 1007 unusable audio, 1013 try again later).
+@app.websocket("/speech-to-text/stream")
+async def speech_to_text_stream(websocket: WebSocket):
+    await websocket.accept()
+    start = time.monotonic()
+    received = 0
+
+    async def frames():
+        nonlocal received
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            if message.get("bytes"):
+                received += len(message["bytes"])
+                if received > uploads.MAX_AUDIO_BYTES:
+                    raise uploads.UploadTooLarge(received, uploads.MAX_AUDIO_BYTES)
+                yield message["bytes"]
+            elif message.get("text", "").strip() == "end":
+                return
+
+    try:
+        try:
+            config = stream_stt_config(websocket.query_params)
+        except ValueError as e:
+            await websocket.send_json({"type": "error", "error": str(e)})
+            await websocket.close(code=1008)  # Policy violation
+            return
+        log.info("stt_stream.start", encoding=config["encoding"], sampleRateHertz=config["sampleRateHertz"])
+        async for event in stt_recognizer.recognize(frames(), config):
+            if event["type"] == "final":
+                event["language_code"] = event["languageCode"]  # Frontend compatibility
+                metrics.observe("stt_stream.total_ms", (time.monotonic() - start) * 1000)
+                log.info("stt_stream.final", transcript=event["transcript"][:50], bytes=received)
+            await websocket.send_json(event)
+        await websocket.close()
+    except WebSocketDisconnect:
+        log.info("stt_stream.disconnected")
+    except uploads.UploadTooLarge as e:
+        log.warning("upload.too_large", size=e.size, maxBytes=e.max_bytes)
+        await websocket.send_json({"type": "error", "error": str(e)})
+        await websocket.close(code=1009)  # Message too big
+    except RejectedAudio as e:
+        await websocket.send_json({"type": "error", "error": str(e)})
+        await websocket.close(code=1007)  # Invalid payload data
+    except upstream.UpstreamUnavailable as e:
+        await websocket.send_json({"type": "error", "error": str(e), "retryAfter": e.retry_after})
+        await websocket.close(code=1013)  # Try again later
+    except httpx.HTTPStatusError as e:
+        await websocket.send_json({"type": "error", "error": e.response.text})
+        await websocket.close(code=1011)
+    except Exception as e:
+        log.error("stt_stream.error", error=str(e))
+        await websocket.send_json({"type": "error", "error": f"Processing error: {str(e)}"})
+        await websocket.close(code=1011)
+
+RANGE_PATTERN = re.compile(r"bytes=(\d*)-(\d*)$")
+
+def audio_response(request: Request, audio_bytes: bytes, audio_key: str, media_type: str = "audio/mpeg") -> Response:
+    """
+    Raw audio response with Content-Length, honouring a single HTTP Range request
+    so mobile players can start playback before the whole file has arrived.
+    """
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "public, max-age=86400, immutable",
+        "Content-Location": f"/text-to-speech/audio/{audio_key}",
+        "ETag": f'"{audio_key}"'
+    }
+    total = len(audio_bytes)
+    range_header = request.headers.get("range")
+    match = RANGE_PATTERN.match(range_header.strip()) if range_header else None
+    if range_header and match and (match.group(1) or match.group(2)):
+        first, last = match.groups()
+        if first:
+            start, end = int(first), min(int(last), total - 1) if last else total - 1
+        else:
+            start, end = max(0, total - int(last)), total - 1
+        if start >= total or start > end:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{total}"})
+        headers["Content-Range"] = f"bytes {start}-{end}/{total}"
+        return Response(content=audio_bytes[start:end + 1], status_code=206, media_type=media_type, headers=headers)
+    return Response(content=audio_bytes, media_type=media_type, headers=headers)
+
+def wants_binary_audio(request: Request, binary: bool) -> bool:
+    # Audio types next to application/json only say which encodings the client can play
+    accept = request.headers.get("accept", "")
+    if binary:
+        return True
+    return "application/json" not in accept and any(
+        media_type in accept for media_type in ("audio/mpeg", "audio/ogg", "audio/opus")
+    )
+
+def sniff_audio_media_type(audio_bytes: bytes) -> str:
+    return "audio/ogg" if audio_bytes[:4] == b"OggS" else "audio/mpeg"
+
+# Cached TTS audio by content key, e.g. for players that fetch with Range requests
+@app.get("/text-to-speech/audio/{audio_key}")
+async def text_to_speech_audio(request: Request, audio_key: str):
+    audio_bytes = None
+    if re.fullmatch(r"[0-9a-f]{64}", audio_key):
+        audio_bytes = audio_bank.get(audio_key) or await tts_cache.get(audio_key)
+    if audio_bytes is None:
+        return JSONResponse(status_code=404, content={"error": "Audio not found or expired"})
+    media_type = sniff_audio_media_type(audio_bytes)
+    metrics.incr(f"tts.bytes_served.{'opus' if media_type == 'audio/ogg' else 'mp3'}", len(audio_bytes))
+    return audio_response(request, audio_bytes, audio_key, media_type)
+
+# Fixed phrase: "greeting" or a FIXED_REPLIES name, in the negotiated audio format.
+# Served from the audio bank when it has the clip, otherwise synthesized (and cached).
+# Returns {"audioContent": base64, "mimeType"} by default; raw audio with Accept: audio/* or ?binary=true
+@app.get("/text-to-speech/phrase/{phrase}")
+async def text_to_speech_phrase(request: Request, phrase: str, languageCode: str = "en-US", binary: bool = False):
+    text = GREETINGS.get(languageCode) if phrase == "greeting" else FIXED_REPLIES.get(phrase)
+    if text is None:
+        return JSONResponse(status_code=404, content={"error": f"No phrase '{phrase}' for {languageCode}"})
+    binary = wants_binary_audio(request, binary)
+    audio_format = negotiate_audio_format(request)
+    try:
+        audio_key, audio_bytes = await synthesize_text(clean_text_for_tts(text), languageCode, audio_format)
+    except httpx.HTTPStatusError as e:
+        return JSONResponse(status_code=502, content={"error": e.response.text})
+    except upstream.UpstreamUnavailable as e:
+        return service_unavailable(e)
+    metrics.incr(f"tts.bytes_served.{audio_format}", len(audio_bytes))
+    if binary:
+        response = audio_response(request, audio_bytes, audio_key, audio_media_type(audio_format))
+        response.headers["Vary"] = AUDIO_NEGOTIATION_HEADERS
+        return response
+    return JSONResponse(
+        {"audioContent": base64.b64encode(audio_bytes).decode("utf-8"), "mimeType": audio_media_type(audio_format)},
+        headers={"Vary": AUDIO_NEGOTIATION_HEADERS}
+    )
+
+# Google TTS rejects requests over 5000 bytes; stay conservatively below it
+TTS_MAX_CHUNK_BYTES = 4500
+TTS_CHUNK_CONCURRENCY = int(os.getenv("HASIRI_TTS_CHUNK_CONCURRENCY", "4"))
+TTS_URL = "https://texttospeech.googleapis.com/v1/text:synthesize"
+
+# Use specific voice names for Indian languages for better quality
+TTS_VOICE_NAMES = {
+    "ta-IN": "ta-IN-Standard-A",  # Tamil female voice
+    "hi-IN": "hi-IN-Standard-A",  # Hindi female voice
+    "te-IN": "te-IN-Standard-A",  # Telugu female voice
+    "kn-IN": "kn-IN-Standard-A",  # Kannada female voice
+    "ml-IN": "ml-IN-Standard-A",  # Malayalam female voice
+    "bn-IN": "bn-IN-Standard-A",  # Bengali female voice
+    "gu-IN": "gu-IN-Standard-A",  # Gujarati female voice
+    "pa-IN": "pa-IN-Standard-A",  # Punjabi female voice
+    "mr-IN": "mr-IN-Standard-A",  # Marathi female voice
+    "en-US": "en-US-Standard-C",  # English female voice
+}
+
+# Audio encodings by client bandwidth. Opus needs roughly half the bytes of MP3 for
+# speech, and 16 kHz Opus is still a clear voice on metered 2G data
+AUDIO_FORMATS = {
+    "mp3": {"audioEncoding": "MP3"},
+    "opus": {"audioEncoding": "OGG_OPUS"},
+    "opus-low": {"audioEncoding": "OGG_OPUS", "sampleRateHertz": 16000},
+}
+AUDIO_MEDIA_TYPES = {"MP3": "audio/mpeg", "OGG_OPUS": "audio/ogg"}
+SLOW_NETWORKS = {"slow-2g", "2g"}
+AUDIO_NEGOTIATION_HEADERS = "Accept, Save-Data, ECT, X-Network-Class"
+
+def negotiate_audio_format(request: Request) -> str:
+    """
+    Pick an AUDIO_FORMATS profile for this client. Opus is only sent to clients that
+    accept it (Accept: audio/ogg or audio/opus), at the low sample rate when they ask
+    to save data (Save-Data: on) or report a 2G link (ECT client hint or X-Network-Class).
+    Everybody else keeps getting MP3.
+    """
+    accept = request.headers.get("accept", "")
+    if "audio/ogg" not in accept and "audio/opus" not in accept:
+        return "mp3"
+    network = (request.headers.get("ect") or request.headers.get("x-network-class", "")).lower()
+    if request.headers.get("save-data", "").lower() == "on" or network in SLOW_NETWORKS:
+        return "opus-low"
+    return "opus"
+
+def audio_media_type(audio_format: str) -> str:
+    return AUDIO_MEDIA_TYPES[AUDIO_FORMATS[audio_format]["audioEncoding"]]
+
+def tts_voice_config(languageCode: str) -> dict:
+    """
+    Select appropriate voice based on language.
+    """
+    voice_config = {"languageCode": languageCode, "ssmlGender": "FEMALE"}
+    if languageCode in TTS_VOICE_NAMES:
+        voice_config["name"] = TTS_VOICE_NAMES[languageCode]
+    return voice_config
+
+def tts_audio_key(text: str, languageCode: str, voice_config: dict, audio_format: str = "mp3") -> str:
+    # e.g. "MP3" or "OGG_OPUS@16000"; plain MP3 keeps the key it always had
+    audio_encoding = "@".join(str(value) for value in AUDIO_FORMATS[audio_format].values())
+    return hash_key(text, languageCode, voice_config.get("name", ""), audio_encoding)
+
+def split_tts_chunks(text: str, max_bytes: int = TTS_MAX_CHUNK_BYTES) -> list:
+    """
+    Split text at sentence boundaries into chunks that each fit in one TTS request.
+    A single sentence longer than the limit is split at word boundaries.
+    """
+    return segmenter.split_to_budget(text, max_bytes)
+
+def join_audio(parts: list, audio_format: str) -> bytes:
+    """
+    Concatenate synthesized chunks into one playable stream. MP3 frames simply follow
+    each other once the ID3 tags are dropped; Ogg streams chain (one logical stream
+    after another), which Ogg players handle without any remuxing.
+    """
+    if AUDIO_FORMATS[audio_format]["audioEncoding"] != "MP3":
+        return b"".join(parts)
+    return parts[0] + b"".join(strip_id3(part) for part in parts[1:])
+
+def strip_id3(audio_bytes: bytes) -> bytes:
+    """
+    Drop a leading ID3v2 tag so MP3 chunks can be concatenated into one stream.
+    """
+    if len(audio_bytes) < 10 or audio_bytes[:3] != b"ID3":
+        return audio_bytes
+    size = 0
+    for byte in audio_bytes[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    footer = 10 if audio_bytes[5] & 0x10 else 0
+    return audio_bytes[10 + size + footer:]
+
+async def synthesize_chunk(text: str, languageCode: str, voice_config: dict, audio_format: str = "mp3") -> tuple:
+    """
+    Synthesize one chunk of cleaned text (at most TTS_MAX_CHUNK_BYTES) in an AUDIO_FORMATS profile.
+    Served from the TTS cache when possible; identical concurrent requests share one call.
+    Returns (audio key, audio bytes). Raises httpx.HTTPStatusError on an upstream error.
+    """
+    audio_key = tts_audio_key(text, languageCode, voice_config, audio_format)
+    audio_bytes = audio_bank.get(audio_key)
+    if audio_bytes is not None:
+        log.debug("tts.audio_bank_hit", bytes=len(audio_bytes))
+        return audio_key, audio_bytes
+    audio_bytes = await tts_cache.get(audio_key)
+    if audio_bytes is not None:
+        log.debug("tts.cache_hit", bytes=len(audio_bytes))
+        return audio_key, audio_bytes
+
+    data = {
+        "input": {"text": text},
+        "voice": voice_config,
+        "audioConfig": AUDIO_FORMATS[audio_format]
+    }
+    params = {"key": GOOGLE_SPEECH_API_KEY}
+    response = await tts_flight.do(audio_key, lambda: upstream.post("tts", TTS_URL, params=params, json=data))
+    log.debug("tts.upstream_status", status=response.status_code)
+    if not response.is_success:
+        log.error("tts.upstream_error", status=response.status_code, body=response.text)
+        response.raise_for_status()
+
+    audio_bytes = base64.b64decode(response.json().get("audioContent", ""))
+    if audio_bytes:
+        await tts_cache.set(audio_key, audio_bytes)
+    return audio_key, audio_bytes
+
+async def synthesize_text(cleaned_text: str, languageCode: str, audio_format: str = "mp3") -> tuple:
+    """
+    Synthesize cleaned text of any length. Long text is split at sentence boundaries,
+    the chunks are synthesized concurrently (bounded) and concatenated in order,
+    so the total time is close to that of the slowest chunk.
+    Returns (audio key, audio bytes).
+    """
+    voice_config = tts_voice_config(languageCode)
+    chunks = split_tts_chunks(cleaned_text)
+    if len(chunks) <= 1:
+        return await synthesize_chunk(cleaned_text, languageCode, voice_config, audio_format)
+
+    audio_key = tts_audio_key(cleaned_text, languageCode, voice_config, audio_format)
+    audio_bytes = await tts_cache.get(audio_key)
+    if audio_bytes is not None:
+        log.debug("tts.cache_hit", bytes=len(audio_bytes))
+        return audio_key, audio_bytes
+
+    log.info("tts.chunked", chunks=len(chunks))
+    semaphore = asyncio.Semaphore(TTS_CHUNK_CONCURRENCY)
+
+    async def synthesize(chunk: str) -> bytes:
+        async with semaphore:
+            _, chunk_audio = await synthesize_chunk(chunk, languageCode, voice_config, audio_format)
+            return chunk_audio
+
+    parts = await asyncio.gather(*(synthesize(chunk) for chunk in chunks))
+    audio_bytes = join_audio(parts, audio_format)
+    await tts_cache.set(audio_key, audio_bytes)
+    return audio_key, audio_bytes
+
+def progressive_tts_chunks(text: str) -> list:
+    """
+    Chunks for streamed synthesis: the first sentence on its own so its audio
+    arrives quickly, then chunks with a doubling byte budget up to the TTS limit.
+    """
+    return segmenter.split_to_budget(text, TTS_MAX_CHUNK_BYTES, budgets=(0, 512, 1024, 2048, 4096))
+
+async def synthesize_in_order(texts, languageCode: str, window: int = TTS_CHUNK_CONCURRENCY, audio_format: str = "mp3"):
+    """
+    Synthesize an async iterable of cleaned text chunks and yield audio bytes in input order
+    as soon as each chunk's audio (and all before it) is ready.
+    At most `window` chunks are synthesized ahead of the consumer; when the consumer is
+    slow, reading from `texts` pauses (backpressure). Closing the generator, e.g. on client
+    disconnect, cancels the reader and every outstanding synthesis.
+    """
+    voice_config = tts_voice_config(languageCode)
+    mp3 = AUDIO_FORMATS[audio_format]["audioEncoding"] == "MP3"
+    queue = asyncio.Queue(maxsize=window)
+
+    async def produce():
+        try:
+            async for text in texts:
+                if text.strip():
+                    await queue.put(asyncio.create_task(synthesize_chunk(text, languageCode, voice_config, audio_format)))
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            await queue.put(exc)
+            return
+        await queue.put(None)
+
+    producer = asyncio.create_task(produce())
+    first = True
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            _, audio_bytes = await item
+            yield strip_id3(audio_bytes) if mp3 and not first else audio_bytes
+            first = False
+    finally:
+        producer.cancel()
+        while not queue.empty():
+            item = queue.get_nowait()
+            if isinstance(item, asyncio.Task):
+                item.cancel()
+
+async def iterate(items):
+    for item in items:
+        yield item
+
+# Progressive TTS: MP3 audio is streamed (chunked transfer) sentence by sentence
+# while later sentences are still being synthesized
+@app.post("/text-to-speech/stream")
+async def text_to_speech_stream(request: Request, text: str = Form(...), languageCode: str = Form("en-US")):
+    audio_format = negotiate_audio_format(request)
+    log.info("tts_stream.request", languageCode=languageCode, format=audio_format)
+    cleaned_text = clean_text_for_tts(text)
+    chunks = progressive_tts_chunks(cleaned_text)
+    log.debug("tts_stream.chunked", chunks=len(chunks))
+
+    async def audio():
+        start = time.monotonic()
+        sent = 0
+        try:
+            async for audio_bytes in synthesize_in_order(iterate(chunks), languageCode, audio_format=audio_format):
+                if not sent:
+                    first_audio = time.monotonic() - start
+                    metrics.observe("tts_stream.first_audio_ms", first_audio * 1000)
+                    log.info("tts_stream.first_audio", seconds=round(first_audio, 2))
+                sent += len(audio_bytes)
+                metrics.incr(f"tts.bytes_served.{audio_format}", len(audio_bytes))
+                yield audio_bytes
+            log.info("tts_stream.completed", bytes=sent)
+        except (httpx.HTTPStatusError, upstream.UpstreamUnavailable) as e:
+            # Headers are already sent; end the stream early
+            log.error("tts_stream.stopped", error=str(e))
+
+    return StreamingResponse(
+        audio(),
+        media_type=audio_media_type(audio_format),
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "Vary": AUDIO_NEGOTIATION_HEADERS}
+    )
+
 # Text-to-Speech endpoint
+# Returns {"audioContent": base64, "mimeType": ...} by default; raw audio bytes with
+# Accept: audio/mpeg (or audio/ogg) or ?binary=true. The encoding follows negotiate_audio_format.
 @app.post("/text-to-speech")
-async def text_to_speech(text: str = Form(...), languageCode: str = Form("en-US")):
+async def text_to_speech(
+    request: Request,
+    http_response: Response,
+    text: str = Form(...),
+    languageCode: str = Form("en-US"),
+    binary: bool = False
+):
+    binary = wants_binary_audio(request, binary)
+    audio_format = negotiate_audio_format(request)
     try:
-        print(f"🔊 Processing text-to-speech")
-        print(f"🌐 Using languageCode: {languageCode}")
-        print(f"📝 Original text length: {len(text)} characters")
+        log.info("tts.request", languageCode=languageCode, format=audio_format, chars=len(text))
         
         # Clean text to remove symbols and formatting that TTS might pronounce
         cleaned_text = clean_text_for_tts(text)
-        print(f"🧹 Cleaned text length: {len(cleaned_text)} characters")
+        log.debug("tts.cleaned", chars=len(cleaned_text))
         
-        headers = {"Content-Type": "application/json"}
-        tts_url = f"https://texttospeech.googleapis.com/v1/text:synthesize?key={GOOGLE_SPEECH_API_KEY}"
+        audio_key, audio_bytes = await synthesize_text(cleaned_text, languageCode, audio_format)
+        log.info("tts.synthesized", bytes=len(audio_bytes), voice=TTS_VOICE_NAMES.get(languageCode))
+        metrics.incr(f"tts.bytes_served.{audio_format}", len(audio_bytes))
         
-        # Handle long text by truncating intelligently
-        tts_text = cleaned_text
-        if len(cleaned_text.encode('utf-8')) > 4500:  # Conservative limit to avoid 5000 byte limit
-            print(f"⚠️ Text too long for TTS ({len(cleaned_text.encode('utf-8'))} bytes), truncating...")
-            
-            # Try to find natural break points (sentences)
-            sentences = cleaned_text.split('।')  # Hindi sentence separator
-            if len(sentences) == 1:
-                sentences = cleaned_text.split('.')  # English sentence separator
-            
-            if len(sentences) > 1:
-                # Take first few sentences that fit within limit
-                tts_text = ""
-                for sentence in sentences:
-                    test_text = tts_text + sentence + "।" if tts_text else sentence
-                    if len(test_text.encode('utf-8')) < 4500:
-                        tts_text = test_text
-                    else:
-                        break
-                
-                if not tts_text:  # Fallback if even first sentence is too long
-                    tts_text = cleaned_text[:1000] + "..."
-            else:
-                # Simple truncation if no sentence breaks found
-                tts_text = cleaned_text[:1000] + "..."
-            
-            print(f"✂️ TTS text truncated to {len(tts_text.encode('utf-8'))} bytes")
-        
-        # Select appropriate voice based on language
-        voice_config = {"languageCode": languageCode, "ssmlGender": "FEMALE"}
-        
-        # Use specific voice names for Indian languages for better quality
-        voice_names = {
-            "ta-IN": "ta-IN-Standard-A",  # Tamil female voice
-            "hi-IN": "hi-IN-Standard-A",  # Hindi female voice
-            "te-IN": "te-IN-Standard-A",  # Telugu female voice
-            "kn-IN": "kn-IN-Standard-A",  # Kannada female voice
-            "ml-IN": "ml-IN-Standard-A",  # Malayalam female voice
-            "bn-IN": "bn-IN-Standard-A",  # Bengali female voice
-            "gu-IN": "gu-IN-Standard-A",  # Gujarati female voice
-            "pa-IN": "pa-IN-Standard-A",  # Punjabi female voice
-            "mr-IN": "mr-IN-Standard-A",  # Marathi female voice
-            "en-US": "en-US-Standard-C",  # English female voice
+        if binary:
+            response = audio_response(request, audio_bytes, audio_key, audio_media_type(audio_format))
+            response.headers["Vary"] = AUDIO_NEGOTIATION_HEADERS
+            return response
+        http_response.headers["Vary"] = AUDIO_NEGOTIATION_HEADERS
+        return {
+            "audioContent": base64.b64encode(audio_bytes).decode("utf-8"),
+            "mimeType": audio_media_type(audio_format)
         }
-        
-        if languageCode in voice_names:
-            voice_config["name"] = voice_names[languageCode]
-            print(f"🎭 Using voice: {voice_names[languageCode]}")
-        else:
-            print(f"🎭 Using default voice for: {languageCode}")
-        
-        data = {
-            "input": {"text": tts_text},
-            "voice": voice_config,
-            "audioConfig": {"audioEncoding": "MP3"}
-        }
-        
-        response = requests.post(tts_url, headers=headers, json=data)
-        print(f"🔍 TTS response status: {response.status_code}")
-        
-        if response.ok:
-            result = response.json()
-            audio_content = result.get("audioContent", "")
-            print(f"✅ TTS successful, audio content length: {len(audio_content)} chars")
-            return {"audioContent": audio_content}
-        else:
-            print(f"❌ TTS error: {response.text}")
-            return {"error": response.text}
             
+    except httpx.HTTPStatusError as e:
+        if binary:
+            return JSONResponse(status_code=502, content={"error": e.response.text})
+        return {"error": e.response.text}
+    except upstream.UpstreamUnavailable as e:
+        return service_unavailable(e)
     except Exception as e:
-        print(f"❌ Text-to-speech error: {str(e)}")
+        log.error("tts.error", error=str(e))
         return {"error": f"Processing error: {str(e)}"}
 
+def build_chat_prompt(text: str, language: str) -> str:
+    """
+    Build the native-speaker Gemini prompt used by /chat and /chat/stream.
+    """
+    language_name = LANGUAGE_NAMES.get(language, "English")
+
+    # Native speaker context based on language
+    native_context = {
+        "ta": "நீங்கள் ஒரு தமிழ் விவசாயி மற்றும் விவசாய நிபுணர். தமிழ்நாட்டின் உள்ளூர் விவசாய முறைகள், பயிர்கள், மற்றும் சூழ்நிலைகளை நன்கு தெரிந்தவர்.",
+        "hi": "आप एक भारतीय किसान और कृषि विशेषज्ञ हैं। भारतीय खेती, फसलों और स्थानीय परिस्थितियों की गहरी समझ रखते हैं।",
+        "te": "మీరు ఒక తెలుగు రైతు మరియు వ్యవసాయ నిపుణుడు. ఆంధ్రప్రదేశ్ మరియు తెలంగాణ వ్యవసాయ పద్ధతులను బాగా తెలుసు.",
+        "kn": "ನೀವು ಕನ್ನಡ ರೈತ ಮತ್ತು ಕೃಷಿ ತಜ್ಞ. ಕರ್ನಾಟಕದ ಸ್ಥಳೀಯ ಕೃಷಿ ವಿಧಾನಗಳನ್ನು ಚೆನ್ನಾಗಿ ತಿಳಿದಿದ್ದೀರಿ.",
+        "ml": "നിങ്ങൾ ഒരു മലയാളി കർഷകനും കാർഷിക വിദഗ്ധനുമാണ്. കേരളത്തിന്റെ പ്രാദേശിക കാർഷിക രീതികൾ നന്നായി അറിയാം.",
+        "bn": "আপনি একজন বাঙালি কৃষক এবং কৃষি বিশেষজ্ঞ। পশ্চিমবঙ্গ ও বাংলাদেশের স্থানীয় কৃষি পদ্ধতি ভালো জানেন।",
+        "gu": "તમે એક ગુજરાતી ખેડૂત અને કૃષિ નિષ્ણાત છો. ગુજરાતની સ્થાનિક કૃષિ પદ્ધતિઓ સારી રીતે જાણો છો।",
+        "pa": "ਤੁਸੀਂ ਇੱਕ ਪੰਜਾਬੀ ਕਿਸਾਨ ਅਤੇ ਖੇਤੀਬਾੜੀ ਮਾਹਿਰ ਹੋ। ਪੰਜਾਬ ਦੇ ਸਥਾਨਕ ਖੇਤੀਬਾੜੀ ਦੇ ਤਰੀਕਿਆਂ ਨੂੰ ਚੰਗੀ ਤਰ੍ਹਾਂ ਜਾਣਦੇ ਹੋ।",
+        "mr": "तुम्ही एक मराठी शेतकरी आणि कृषी तज्ञ आहात. महाराष्ट्राच्या स्थानिक शेती पद्धती चांगल्या माहीत आहेत।",
+        "en": "You are an experienced Indian farmer and agricultural expert familiar with diverse farming practices across India."
+    }
+
+    # Enhanced agricultural context with VERY strict native speaker enforcement
+    native_intro = native_context.get(language, native_context["en"])
+
+    prompt = (
+        f"{native_intro} "
+        f"आपको अपनी मातृभाषा {language_name} में एक स्थानीय किसान की तरह जवाब देना है। "
+        f"CRITICAL: आपका पूरा उत्तर केवल {language_name} भाषा में होना चाहिए। "
+        f"किसी भी अन्य भाषा का एक भी शब्द उपयोग न करें। "
+        f"आप एक स्थानीय {language_name} किसान हैं, विदेशी नहीं। "
+        f"सरल, व्यावहारिक और क्षेत्रीय रूप से प्रासंगिक कृषि सलाह दें। "
+        f"तुरंत कार्यान्वित किए जा सकने वाले कदमों पर ध्यान दें। "
+        f"फसल, मौसम, कीट, रोग, उर्वरक, सिंचाई, सरकारी योजनाएं, बाजार भाव, जैविक खेती, और मौसमी सलाह जैसे विषयों को कवर करें। "
+        f"हमेशा किसानों के प्रति उत्साहजनक और सहायक रहें। "
+        f"TTS के लिए सरल टेक्स्ट का उपयोग करें, विशेष प्रतीक या बुलेट पॉइंट न लगाएं। "
+        f"बुलेट पॉइंट के बजाय नंबर वाली सूची या पैराग्राफ का उपयोग करें। "
+        f"याद रखें: आपका पूरा जवाब केवल {language_name} भाषा में होना चाहिए। कोई अंग्रेजी शब्द नहीं। "
+        f"किसान का संदेश: {text}"
+    )
+    return prompt
+
+def extract_gemini_text(result: dict) -> str:
+    """
+    Pull the reply text out of a Gemini generateContent (or stream chunk) response.
+    """
+    return result.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "")
+
 # Chat endpoint with native speaker responses
 @app.post("/chat")
-async def chat(text: str = Form(...), languageCode: str = Form("en-US")):
+async def chat(
+    request: Request,
+    http_response: Response,
+    text: str = Form(...),
+    languageCode: str = Form("en-US")
+):
+    # Clients that ask for an event stream get the SSE variant
+    if "text/event-stream" in request.headers.get("accept", ""):
+        return await chat_stream(request, text, languageCode)
+
     try:
         # Extract language part (e.g., 'ta' from 'ta-IN')
         language = languageCode.split('-')[0]
         
-        print(f"💬 Processing chat request")
-        print(f"🌐 Detected languageCode: {languageCode}")
-        print(f"� Extracted language: {language}")
-        print(f"�📝 User message: {text[:100]}...")
-        
-        headers = {"Content-Type": "application/json"}
-        params = {"key": GEMINI_API_KEY}
-        
-        # Map language codes to language names for better AI understanding
-        language_names = {
-            "ta": "Tamil",
-            "hi": "Hindi", 
-            "te": "Telugu",
-            "kn": "Kannada",
-            "ml": "Malayalam",
-            "bn": "Bengali",
-            "gu": "Gujarati",
-            "pa": "Punjabi",
-            "mr": "Marathi",
-            "en": "English"
-        }
-        
-        language_name = language_names.get(language, "English")
+        log.info("chat.request", languageCode=languageCode, chars=len(text))
+        log.debug("chat.message", text=text[:100])
         
-        # Native speaker context based on language
-        native_context = {
-            "ta": "நீங்கள் ஒரு தமிழ் விவசாயி மற்றும் விவசாய நிபுணர். தமிழ்நாட்டின் உள்ளூர் விவசாய முறைகள், பயிர்கள், மற்றும் சூழ்நிலைகளை நன்கு தெரிந்தவர்.",
-            "hi": "आप एक भारतीय किसान और कृषि विशेषज्ञ हैं। भारतीय खेती, फसलों और स्थानीय परिस्थितियों की गहरी समझ रखते हैं।",
-            "te": "మీరు ఒక తెలుగు రైతు మరియు వ్యవసాయ నిపుణుడు. ఆంధ్రప్రదేశ్ మరియు తెలంగాణ వ్యవసాయ పద్ధతులను బాగా తెలుసు.",
-            "kn": "ನೀವು ಕನ್ನಡ ರೈತ ಮತ್ತು ಕೃಷಿ ತಜ್ಞ. ಕರ್ನಾಟಕದ ಸ್ಥಳೀಯ ಕೃಷಿ ವಿಧಾನಗಳನ್ನು ಚೆನ್ನಾಗಿ ತಿಳಿದಿದ್ದೀರಿ.",
-            "ml": "നിങ്ങൾ ഒരു മലയാളി കർഷകനും കാർഷിക വിദഗ്ധനുമാണ്. കേരളത്തിന്റെ പ്രാദേശിക കാർഷിക രീതികൾ നന്നായി അറിയാം.",
-            "bn": "আপনি একজন বাঙালি কৃষক এবং কৃষি বিশেষজ্ঞ। পশ্চিমবঙ্গ ও বাংলাদেশের স্থানীয় কৃষি পদ্ধতি ভালো জানেন।",
-            "gu": "તમે એક ગુજરાતી ખેડૂત અને કૃષિ નિષ્ણાત છો. ગુજરાતની સ્થાનિક કૃષિ પદ્ધતિઓ સારી રીતે જાણો છો।",
-            "pa": "ਤੁਸੀਂ ਇੱਕ ਪੰਜਾਬੀ ਕਿਸਾਨ ਅਤੇ ਖੇਤੀਬਾੜੀ ਮਾਹਿਰ ਹੋ। ਪੰਜਾਬ ਦੇ ਸਥਾਨਕ ਖੇਤੀਬਾੜੀ ਦੇ ਤਰੀਕਿਆਂ ਨੂੰ ਚੰਗੀ ਤਰ੍ਹਾਂ ਜਾਣਦੇ ਹੋ।",
-            "mr": "तुम्ही एक मराठी शेतकरी आणि कृषी तज्ञ आहात. महाराष्ट्राच्या स्थानिक शेती पद्धती चांगल्या माहीत आहेत।",
-            "en": "You are an experienced Indian farmer and agricultural expert familiar with diverse farming practices across India."
+        reply, cache_status = await chat_reply(text, language, bypass=cache_bypassed(request))
+        http_response.headers["X-Cache"] = cache_status
+        return {"reply": reply}
+            
+    except upstream.CircuitOpen as e:
+        log.warning("chat.short_circuited", error=str(e))
+        return {"reply": FIXED_REPLIES["chat_error"]}
+    except upstream.UpstreamOverloaded as e:
+        return service_unavailable(e)
+    except Exception as e:
+        log.error("chat.error", error=str(e))
+        return {"reply": FIXED_REPLIES["chat_trouble"]}
+
+async def chat_reply(text: str, language: str, bypass: bool = False) -> tuple:
+    """
+    Reply to a farmer's question from the caches or Gemini.
+    Returns (reply, cache status); the fixed error reply if Gemini answers with an error.
+    Raises upstream.UpstreamUnavailable when Gemini is refused locally.
+    """
+    cache_key = chat_cache_key(text, language)
+    cached, cache_status = (None, "BYPASS") if bypass else await cached_chat_reply(text, language, cache_key)
+    if cached is not None:
+        log.info("chat.cache_hit", status=cache_status)
+        return cached, cache_status
+    
+    params = {"key": GEMINI_API_KEY}
+    
+    prompt = build_chat_prompt(text, language)
+    
+    data = {
+        "contents": [
+            {"role": "user", "parts": [{"text": prompt}]}
+        ]
+    }
+    
+    if CHAT_HEDGING and len(text) <= CHAT_HEDGE_MAX_CHARS:
+        call = lambda: upstream.hedged_post("gemini", GEMINI_API_URL, params=params, json=data)
+    else:
+        call = lambda: upstream.post("gemini", GEMINI_API_URL, params=params, json=data)
+    response = await chat_flight.do(cache_key, call)
+    log.debug("chat.upstream_status", status=response.status_code)
+    
+    if not response.is_success:
+        log.error("chat.upstream_error", status=response.status_code, body=response.text)
+        return FIXED_REPLIES["chat_error"], cache_status
+    reply = extract_gemini_text(response.json())
+    log.info("chat.reply", reply=reply[:100])
+    if reply and not bypass:
+        await store_chat_reply(text, language, cache_key, reply)
+    return reply, cache_status
+
+def chat_cache_key(text: str, language: str) -> str:
+    return hash_key(language, normalize_question(text))
+
+async def cached_chat_reply(text: str, language: str, cache_key: str):
+    """
+    Look up a cached reply: exact match first, then semantic near-duplicate.
+    Returns (reply, cache status) where reply is None on a miss.
+    """
+    cached = chat_cache.get(cache_key)
+    if cached is not None:
+        return cached, "HIT"
+    if SEMANTIC_CACHE_ENABLED and language in LANGUAGE_NAMES:
+        cached, similarity = await asyncio.to_thread(semantic_chat_cache.lookup, text, language)
+        if cached is not None:
+            log.info("chat.semantic_cache_hit", similarity=round(similarity, 3))
+            return cached, "HIT-SEMANTIC"
+    return None, "MISS"
+
+async def store_chat_reply(text: str, language: str, cache_key: str, reply: str):
+    if cache_key in chat_cache:
+        # Already stored by another request coalesced onto the same Gemini call
+        return
+    chat_cache.set(cache_key, reply, len(reply.encode("utf-8")))
+    if SEMANTIC_CACHE_ENABLED and language in LANGUAGE_NAMES:
+        await asyncio.to_thread(semantic_chat_cache.add, text, language, reply)
+
+def cache_bypassed(request: Request) -> bool:
+    # Debugging aid: X-Cache-Bypass: 1 skips cache lookups and stores
+    return request.headers.get("x-cache-bypass", "").lower() in ("1", "true", "yes")
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def gemini_stream_chunks(prompt: str):
+    """
+    Yield reply text chunks from Gemini streamGenerateContent (SSE mode).
+    """
+    params = {"key": GEMINI_API_KEY, "alt": "sse"}
+    data = {
+        "contents": [
+            {"role": "user", "parts": [{"text": prompt}]}
+        ]
+    }
+    async with upstream.stream("gemini", GEMINI_STREAM_URL, params=params, json=data) as response:
+        log.debug("chat_stream.upstream_status", status=response.status_code)
+        if not response.is_success:
+            body = await response.aread()
+            log.error("chat_stream.upstream_error", status=response.status_code, body=body.decode("utf-8", "replace"))
+            response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            chunk = extract_gemini_text(json.loads(line[5:]))
+            if chunk:
+                yield chunk
+
+# Streaming chat endpoint: Gemini chunks are forwarded as Server-Sent Events
+@app.post("/chat/stream")
+async def chat_stream(request: Request, text: str = Form(...), languageCode: str = Form("en-US")):
+    language = languageCode.split('-')[0]
+    log.info("chat_stream.request", languageCode=languageCode, chars=len(text))
+    prompt = build_chat_prompt(text, language)
+    bypass = cache_bypassed(request)
+    cache_key = chat_cache_key(text, language)
+    cached, cache_status = (None, "BYPASS") if bypass else await cached_chat_reply(text, language, cache_key)
+
+    async def events():
+        if cached is not None:
+            log.info("chat.cache_hit", status=cache_status)
+            yield sse_event("chunk", {"text": cached})
+            yield sse_event("done", {"reply": cached})
+            return
+
+        start = time.monotonic()
+        parts = []
+        fallback = None
+        try:
+            async for chunk in gemini_stream_chunks(prompt):
+                if not parts:
+                    ttft = time.monotonic() - start
+                    metrics.observe("chat_stream.ttft_ms", ttft * 1000)
+                    log.info("chat_stream.first_token", seconds=round(ttft, 2))
+                parts.append(chunk)
+                yield sse_event("chunk", {"text": chunk})
+        except upstream.UpstreamUnavailable as e:
+            log.warning("chat_stream.short_circuited", error=str(e))
+            yield sse_event("error", {"error": str(e), "retryAfter": e.retry_after})
+            fallback = FIXED_REPLIES["chat_error"]
+        except httpx.HTTPStatusError:
+            fallback = FIXED_REPLIES["chat_error"]
+        except Exception as e:
+            log.error("chat_stream.error", error=str(e))
+            fallback = FIXED_REPLIES["chat_trouble"]
+
+        reply = "".join(parts)
+        if fallback and not reply:
+            reply = fallback
+        elif not fallback and reply and not bypass:
+            await store_chat_reply(text, language, cache_key, reply)
+        log.info("chat_stream.completed", reply=reply[:100])
+        yield sse_event("done", {"reply": reply})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            "X-Cache": cache_status
         }
-        
-        # Enhanced agricultural context with VERY strict native speaker enforcement
-        native_intro = native_context.get(language, native_context["en"])
-        
-        prompt = (
-            f"{native_intro} "
-            f"आपको अपनी मातृभाषा {language_name} में एक स्थानीय किसान की तरह जवाब देना है। "
-            f"CRITICAL: आपका पूरा उत्तर केवल {language_name} भाषा में होना चाहिए। "
-            f"किसी भी अन्य भाषा का एक भी शब्द उपयोग न करें। "
-            f"आप एक स्थानीय {language_name} किसान हैं, विदेशी नहीं। "
-            f"सरल, व्यावहारिक और क्षेत्रीय रूप से प्रासंगिक कृषि सलाह दें। "
-            f"तुरंत कार्यान्वित किए जा सकने वाले कदमों पर ध्यान दें। "
-            f"फसल, मौसम, कीट, रोग, उर्वरक, सिंचाई, सरकारी योजनाएं, बाजार भाव, जैविक खेती, और मौसमी सलाह जैसे विषयों को कवर करें। "
-            f"हमेशा किसानों के प्रति उत्साहजनक और सहायक रहें। "
-            f"TTS के लिए सरल टेक्स्ट का उपयोग करें, विशेष प्रतीक या बुलेट पॉइंट न लगाएं। "
-            f"बुलेट पॉइंट के बजाय नंबर वाली सूची या पैराग्राफ का उपयोग करें। "
-            f"याद रखें: आपका पूरा जवाब केवल {language_name} भाषा में होना चाहिए। कोई अंग्रेजी शब्द नहीं। "
-            f"किसान का संदेश: {text}"
+    )
+
+def multipart_part(boundary: str, name: str, content_type: str, body: bytes) -> bytes:
+    headers = f"--{boundary}\r\nContent-Type: {content_type}\r\nContent-Disposition: inline; name=\"{name}\"\r\n\r\n"
+    return headers.encode("utf-8") + body + b"\r\n"
+
+def json_part(boundary: str, name: str, data: dict) -> bytes:
+    return multipart_part(boundary, name, "application/json; charset=utf-8", json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+def server_timing(timings: dict) -> str:
+    return ", ".join(f"{stage};dur={ms}" for stage, ms in timings.items())
+
+class Stopwatch:
+    """
+    Per-stage wall-clock timings in ms, also recorded as voice_turn.<stage>_ms metrics.
+    """
+
+    def __init__(self):
+        self.start = self.lap_start = time.monotonic()
+        self.timings = {}
+
+    def lap(self, stage: str):
+        now = time.monotonic()
+        self.timings[stage] = round((now - self.lap_start) * 1000, 1)
+        self.lap_start = now
+        metrics.observe(f"voice_turn.{stage}_ms", self.timings[stage])
+
+    def total(self) -> dict:
+        self.timings["total"] = round((time.monotonic() - self.start) * 1000, 1)
+        metrics.observe("voice_turn.total_ms", self.timings["total"])
+        return self.timings
+
+# One-shot voice turn: speech-to-text -> chat -> text-to-speech in a single round trip.
+# Returns JSON {"transcript", "languageCode", "reply", "audioContent", "mimeType", "timings"}
+# (timings also in a Server-Timing header). With Accept: multipart/mixed the response
+# is streamed as parts while the stages finish: "transcript" and "reply" (JSON), "audio"
+# (raw bytes) and "timings" (JSON), or an "error" part if a later stage fails.
+@app.post("/voice-turn")
+async def voice_turn(request: Request, audio: UploadFile = File(...)):
+    audio_format = negotiate_audio_format(request)
+    watch = Stopwatch()
+    try:
+        log.info("voice_turn.request", filename=audio.filename, format=audio_format)
+        audio_bytes = await uploads.read_upload(audio, uploads.MAX_AUDIO_BYTES)
+        stt = await transcribe_cached(audio_bytes)
+    except uploads.UploadTooLarge as e:
+        log.warning("upload.too_large", size=e.size, maxBytes=e.max_bytes)
+        return JSONResponse(status_code=413, content={"error": str(e)})
+    except httpx.HTTPStatusError as e:
+        return JSONResponse(status_code=502, content={"error": e.response.text})
+    except upstream.UpstreamUnavailable as e:
+        return service_unavailable(e)
+    except Exception as e:
+        log.error("voice_turn.error", stage="stt", error=str(e))
+        return {"error": f"Processing error: {str(e)}"}
+    if "error" in stt:
+        return JSONResponse(status_code=415, content={"error": stt["error"]})
+    watch.lap("stt")
+    transcript = stt["transcript"]
+    languageCode = canonical_language_code(stt["languageCode"])
+    transcribed = {"transcript": transcript, "languageCode": languageCode, "language_code": languageCode}
+
+    async def reply_and_audio():
+        """
+        (reply, audio bytes) for the transcript; nothing to answer for a silent clip.
+        """
+        if not transcript.strip():
+            return "", b""
+        try:
+            reply, _ = await chat_reply(transcript, languageCode.split("-")[0], bypass=cache_bypassed(request))
+        except upstream.CircuitOpen as e:
+            log.warning("chat.short_circuited", error=str(e))
+            reply = FIXED_REPLIES["chat_error"]
+        watch.lap("chat")
+        _, audio_bytes = await synthesize_text(clean_text_for_tts(reply), languageCode, audio_format)
+        metrics.incr(f"tts.bytes_served.{audio_format}", len(audio_bytes))
+        watch.lap("tts")
+        return reply, audio_bytes
+
+    if "multipart/mixed" not in request.headers.get("accept", ""):
+        try:
+            reply, audio_bytes = await reply_and_audio()
+        except httpx.HTTPStatusError as e:
+            return JSONResponse(status_code=502, content={**transcribed, "error": e.response.text})
+        except upstream.UpstreamUnavailable as e:
+            return service_unavailable(e)
+        except Exception as e:
+            log.error("voice_turn.error", error=str(e))
+            return {**transcribed, "error": f"Processing error: {str(e)}"}
+        timings = watch.total()
+        log.info("voice_turn.completed", **timings)
+        return JSONResponse(
+            {
+                **transcribed,
+                "reply": reply,
+                "audioContent": base64.b64encode(audio_bytes).decode("utf-8"),
+                "mimeType": audio_media_type(audio_format),
+                "timings": timings
+            },
+            headers={"Server-Timing": server_timing(timings), "Vary": AUDIO_NEGOTIATION_HEADERS}
         )
-        
-        data = {
-            "contents": [
-                {"role": "user", "parts": [{"text": prompt}]}
-            ]
-        }
-        
-        response = requests.post(GEMINI_API_URL, headers=headers, params=params, json=data)
-        print(f"🔍 Gemini response status: {response.status_code}")
-        
-        if response.ok:
-            result = response.json()
-            reply = result.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "")
-            print(f"✅ Chat response generated: {reply[:100]}...")
-            return {"reply": reply}
+
+    boundary = uuid.uuid4().hex
+
+    async def parts():
+        yield json_part(boundary, "transcript", transcribed)
+        try:
+            reply, audio_bytes = await reply_and_audio()
+        except (httpx.HTTPStatusError, upstream.UpstreamUnavailable) as e:
+            # Headers are already sent; report the failed stage in-band
+            log.error("voice_turn.stopped", error=str(e))
+            yield json_part(boundary, "error", {"error": str(e), "retryAfter": getattr(e, "retry_after", None)})
+        except Exception as e:
+            log.error("voice_turn.error", error=str(e))
+            yield json_part(boundary, "error", {"error": f"Processing error: {str(e)}"})
         else:
-            print(f"❌ Gemini error: {response.text}")
-            return {"reply": "Sorry, I couldn't process your request. Please try again."}
-            
+            yield json_part(boundary, "reply", {"reply": reply})
+            yield multipart_part(boundary, "audio", audio_media_type(audio_format), audio_bytes)
+        timings = watch.total()
+        log.info("voice_turn.completed", **timings)
+        yield json_part(boundary, "timings", timings)
+        yield f"--{boundary}--\r\n".encode("ascii")
+
+    return StreamingResponse(
+        parts(),
+        media_type=f"multipart/mixed; boundary={boundary}",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "Vary": AUDIO_NEGOTIATION_HEADERS}
+    )
+
+class SpokenReply:
+    """
+    A chat reply cut into cleaned TTS chunks while Gemini is still generating it.
+    Each sentence is handed on as soon as the text after it arrives: the first on
+    its own, later ones packed with a doubling byte budget as in progressive_tts_chunks.
+    Iterate chunks() (e.g. into synthesize_in_order); texts and reply fill in as it goes.
+    """
+
+    def __init__(self, text: str, language: str, bypass: bool = False):
+        self.text = text
+        self.language = language
+        self.bypass = bypass
+        self.cache_status = "BYPASS" if bypass else "MISS"
+        self.reply = ""
+        self.texts = []  # Chunks handed on for synthesis, in order
+        self._cursor = 0  # End of the last sentence found in reply
+
+    async def pieces(self):
+        """
+        Reply text as it arrives: a cached reply whole, Gemini's stream chunk by chunk,
+        or the fixed error reply if Gemini fails before saying anything.
+        """
+        cache_key = chat_cache_key(self.text, self.language)
+        if not self.bypass:
+            cached, self.cache_status = await cached_chat_reply(self.text, self.language, cache_key)
+            if cached is not None:
+                log.info("chat.cache_hit", status=self.cache_status)
+                yield cached
+                return
+        parts = []
+        fallback = None
+        try:
+            async for chunk in gemini_stream_chunks(build_chat_prompt(self.text, self.language)):
+                parts.append(chunk)
+                yield chunk
+        except upstream.UpstreamUnavailable as e:
+            log.warning("chat_stream.short_circuited", error=str(e))
+            fallback = FIXED_REPLIES["chat_error"]
+        except httpx.HTTPStatusError:
+            fallback = FIXED_REPLIES["chat_error"]
+        except Exception as e:
+            log.error("chat_stream.error", error=str(e))
+            fallback = FIXED_REPLIES["chat_trouble"]
+        if fallback and not parts:
+            yield fallback
+        elif not fallback and parts and not self.bypass:
+            await store_chat_reply(self.text, self.language, cache_key, "".join(parts))
+
+    async def chunks(self):
+        sentences = segmenter.SentenceBuffer()
+        budgets = iter((0, 512, 1024, 2048, 4096))  # Shared by every pack below
+        async for piece in self.pieces():
+            self.reply += piece
+            for chunk in self._pack(sentences.feed(piece), budgets):
+                yield chunk
+        for chunk in self._pack(sentences.flush(), budgets):
+            yield chunk
+
+    def _pack(self, sentences: list, budgets) -> list:
+        cleaned = []
+        for sentence in sentences:
+            # List markers and headers only count at the start of a line
+            start = self.reply.find(sentence, self._cursor)
+            self._cursor = start + len(sentence)
+            line_start = not self.reply[self.reply.rfind("\n", 0, start) + 1:start].strip()
+            text = clean_text_for_tts(sentence, line_start)
+            if text.strip():
+                cleaned.append(text)
+        if not cleaned:
+            return []
+        chunks = segmenter.pack_segments(cleaned, TTS_MAX_CHUNK_BYTES, budgets=budgets)
+        self.texts.extend(chunks)
+        return chunks
+
+# Pipelined voice turn: the reply is spoken sentence by sentence while Gemini is still
+# writing it. Streams multipart/mixed parts: "transcript" (JSON), then per reply chunk
+# a "segment" (JSON {"index", "text"}) followed by its "audio" (raw bytes, in order,
+# concatenating into one playable stream), then "reply" (JSON, the whole reply) and
+# "timings" (JSON; first_audio is from the transcript to the first audio part), or an
+# "error" part if synthesis fails. At most TTS_CHUNK_CONCURRENCY chunks are synthesized
+# ahead of what the client has read; a client disconnect cancels synthesis and Gemini.
+@app.post("/voice-turn/stream")
+async def voice_turn_stream(request: Request, audio: UploadFile = File(...)):
+    audio_format = negotiate_audio_format(request)
+    watch = Stopwatch()
+    try:
+        log.info("voice_turn.request", filename=audio.filename, format=audio_format, pipelined=True)
+        audio_bytes = await uploads.read_upload(audio, uploads.MAX_AUDIO_BYTES)
+        stt = await transcribe_cached(audio_bytes)
+    except uploads.UploadTooLarge as e:
+        log.warning("upload.too_large", size=e.size, maxBytes=e.max_bytes)
+        return JSONResponse(status_code=413, content={"error": str(e)})
+    except httpx.HTTPStatusError as e:
+        return JSONResponse(status_code=502, content={"error": e.response.text})
+    except upstream.UpstreamUnavailable as e:
+        return service_unavailable(e)
     except Exception as e:
-        print(f"❌ Chat error: {str(e)}")
-        return {"reply": "I'm having trouble right now. Please try again in a moment."}
+        log.error("voice_turn.error", stage="stt", error=str(e))
+        return {"error": f"Processing error: {str(e)}"}
+    if "error" in stt:
+        return JSONResponse(status_code=415, content={"error": stt["error"]})
+    watch.lap("stt")
+    transcript = stt["transcript"]
+    languageCode = canonical_language_code(stt["languageCode"])
+    spoken = SpokenReply(transcript, languageCode.split("-")[0], bypass=cache_bypassed(request))
+    boundary = uuid.uuid4().hex
+
+    async def parts():
+        yield json_part(boundary, "transcript", {"transcript": transcript, "languageCode": languageCode, "language_code": languageCode})
+        audio_parts = synthesize_in_order(spoken.chunks() if transcript.strip() else iterate([]), languageCode, audio_format=audio_format)
+        index = 0
+        try:
+            async for audio_bytes in audio_parts:
+                if index == 0:
+                    watch.lap("first_audio")
+                    log.info("voice_turn.first_audio", sinceRequestMs=round((time.monotonic() - watch.start) * 1000, 1))
+                metrics.incr(f"tts.bytes_served.{audio_format}", len(audio_bytes))
+                yield json_part(boundary, "segment", {"index": index, "text": spoken.texts[index]})
+                yield multipart_part(boundary, "audio", audio_media_type(audio_format), audio_bytes)
+                index += 1
+            watch.lap("audio")
+        except asyncio.CancelledError:
+            log.info("voice_turn.cancelled", segments=index)
+            raise
+        except (httpx.HTTPStatusError, upstream.UpstreamUnavailable) as e:
+            log.error("voice_turn.stopped", error=str(e), segments=index)
+            yield json_part(boundary, "error", {"error": str(e), "retryAfter": getattr(e, "retry_after", None)})
+        except Exception as e:
+            log.error("voice_turn.error", error=str(e), segments=index)
+            yield json_part(boundary, "error", {"error": f"Processing error: {str(e)}"})
+        finally:
+            await audio_parts.aclose()
+        yield json_part(boundary, "reply", {"reply": spoken.reply, "cache": spoken.cache_status})
+        timings = watch.total()
+        log.info("voice_turn.completed", segments=index, **timings)
+        yield json_part(boundary, "timings", timings)
+        yield f"--{boundary}--\r\n".encode("ascii")
+
+    return StreamingResponse(
+        parts(),
+        media_type=f"multipart/mixed; boundary={boundary}",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "Vary": AUDIO_NEGOTIATION_HEADERS}
+    )
 
 # Image analysis endpoint with native language support
 @app.post("/analyze-image")
@@ -539,16 +1603,12 @@ async def analyze_image(
         # Extract language part (e.g., 'ta' from 'ta-IN')
         language = languageCode.split('-')[0]
         
-        print(f"📸 Processing image analysis for file: {file.filename}")
-        print(f"📝 Analysis prompt: {prompt[:100]}...")
-        print(f"🌐 Image analysis languageCode: {languageCode}")
-        print(f"🔤 Extracted language: {language}")
+        log.info("image.request", filename=file.filename, languageCode=languageCode)
+        log.debug("image.prompt", prompt=prompt[:100])
         
-        headers = {"Content-Type": "application/json"}
         params = {"key": GEMINI_API_KEY}
         
-        image_bytes = await file.read()
-        print(f"📊 Image size: {len(image_bytes)} bytes")
+        log.info("image.size", bytes=uploads.check_size(file, uploads.MAX_IMAGE_BYTES))
         
         # Detect MIME type, fallback to image/jpeg if unknown
         mime_type = file.content_type
@@ -563,25 +1623,9 @@ async def analyze_image(
             else:
                 mime_type = "image/jpeg"  # Default fallback
         
-        print(f"🖼️ Detected MIME type: {mime_type}")
+        log.debug("image.mime_type", mimeType=mime_type)
         
-        image_base64 = base64.b64encode(image_bytes).decode("utf-8")
-        
-        # Map language codes to language names for better AI understanding
-        language_names = {
-            "ta": "Tamil",
-            "hi": "Hindi", 
-            "te": "Telugu",
-            "kn": "Kannada",
-            "ml": "Malayalam",
-            "bn": "Bengali",
-            "gu": "Gujarati",
-            "pa": "Punjabi",
-            "mr": "Marathi",
-            "en": "English"
-        }
-        
-        language_name = language_names.get(language, "English")
+        language_name = LANGUAGE_NAMES.get(language, "English")
         
         # Native speaker context for image analysis
         native_context = {
@@ -629,7 +1673,7 @@ async def analyze_image(
                         {
                             "inline_data": {
                                 "mime_type": mime_type,
-                                "data": image_base64
+                                "data": uploads.BASE64_PLACEHOLDER
                             }
                         }
                     ]
@@ -637,21 +1681,35 @@ async def analyze_image(
             ]
         }
         
-        response = requests.post(GEMINI_API_URL, headers=headers, params=params, json=data)
-        print(f"🔍 Image analysis response status: {response.status_code}")
+        # Base64 straight from the spooled upload into the request body
+        body, image_digest = await uploads.base64_json_body(data, file, uploads.MAX_IMAGE_BYTES)
+        flight_key = hash_key(image_digest, mime_type, enhanced_prompt)
+        response = await image_flight.do(
+            flight_key,
+            lambda: upstream.post("gemini", GEMINI_API_URL, params=params, content=body)
+        )
+        log.debug("image.upstream_status", status=response.status_code)
         
-        if response.ok:
+        if response.is_success:
             result = response.json()
-            reply = result.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "")
-            print(f"✅ Image analysis completed: {reply[:100]}...")
+            reply = extract_gemini_text(result)
+            log.info("image.reply", reply=reply[:100])
             return {"reply": reply}
         else:
-            print(f"❌ Image analysis error: {response.text}")
-            return {"reply": "Sorry, I couldn't analyze this image. Please try with a clearer crop image."}
+            log.error("image.upstream_error", status=response.status_code, body=response.text)
+            return {"reply": FIXED_REPLIES["image_error"]}
             
+    except uploads.UploadTooLarge as e:
+        log.warning("upload.too_large", size=e.size, maxBytes=e.max_bytes)
+        return JSONResponse(status_code=413, content={"error": str(e)})
+    except upstream.CircuitOpen as e:
+        log.warning("image.short_circuited", error=str(e))
+        return {"reply": FIXED_REPLIES["image_error"]}
+    except upstream.UpstreamOverloaded as e:
+        return service_unavailable(e)
     except Exception as e:
-        print(f"❌ Image analysis error: {str(e)}")
-        return {"reply": "I'm having trouble analyzing this image. Please try again with a different image."}
+        log.error("image.error", error=str(e))
+        return {"reply": FIXED_REPLIES["image_trouble"]}
 
 if __name__ == "__main__":
     import uvicorn
@@ -659,9 +1717,11 @@ if __name__ == "__main__":
     print("🚀 Starting HASIRI Backend Server...")
     print(f"📁 Using .env file from: {env_path.absolute()}")
     print(f"🌐 Server will be available at: http://localhost:{port}")
-    print(f"📋 API Endpoints:")
-    print(f"   • POST /chat - Chat with AI assistant")
-    print(f"   • POST /speech-to-text - Convert speech to text")
-    print(f"   • POST /text-to-speech - Convert text to speech")
-    print(f"   • POST /analyze-image - Analyze crop images")
+    print("📋 API Endpoints:")
+    print("   • POST /chat - Chat with AI assistant (/chat/stream: Server-Sent Events)")
+    print("   • POST /speech-to-text - Convert speech to text (WebSocket /speech-to-text/stream: live)")
+    print("   • POST /text-to-speech - Convert text to speech (/text-to-speech/stream: progressive)")
+    print("   • POST /voice-turn - Speech in, spoken reply out (/voice-turn/stream: pipelined)")
+    print("   • POST /analyze-image - Analyze crop images")
+    print("   • GET  /metrics - Latency, cache and upstream statistics")
     uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
@@ -0,0 +1,45 @@
+"""
+Minimal in-process metrics registry served as JSON from the /metrics endpoint.
+
+Counters are plain named integers and summaries track count/mean/max of observed
+values (e.g. latencies in ms). Components with richer live state (limiters,
+caches, ...) register a gauge callback that returns a dict snapshot.
+"""
+
+from collections import defaultdict
+
+_counters = defaultdict(int)
+_summaries = {}
+_gauges = {}
+
+
+def incr(name: str, value: int = 1):
+    _counters[name] += value
+
+
+def observe(name: str, value: float):
+    """
+    Record one sample of a summary metric (count / mean / max).
+    """
+    summary = _summaries.setdefault(name, {"count": 0, "sum": 0.0, "max": 0.0})
+    summary["count"] += 1
+    summary["sum"] += value
+    summary["max"] = max(summary["max"], value)
+
+
+def register_gauge(name: str, callback):
+    """
+    Register a zero-argument callable whose dict result is included in snapshot().
+    """
+    _gauges[name] = callback
+
+
+def snapshot() -> dict:
+    return {
+        "counters": dict(_counters),
+        "summaries": {
+            name: {"count": s["count"], "mean": round(s["sum"] / s["count"], 2), "max": round(s["max"], 2)}
+            for name, s in _summaries.items()
+        },
+        "gauges": {name: callback() for name, callback in _gauges.items()},
+    }
@@ -0,0 +1,117 @@
+"""
+Retry policy for upstream calls: retryable status classification, Retry-After
+handling, decorrelated-jitter backoff and a process-wide retry budget.
+
+The budget is a token bucket: every original request deposits `ratio` tokens and
+every retry spends one, so in steady state retries add at most ratio (10%) extra
+load on top of real traffic and cannot amplify an outage.
+"""
+
+import email.utils
+import os
+import random
+import time
+
+import httpx
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+def parse_retry_after(value: str):
+    """
+    Seconds to wait from a Retry-After header (delta-seconds or HTTP-date), or None.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class RetryBudget:
+    def __init__(self, ratio: float = 0.1, max_tokens: float = 10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+
+        self.requests = 0
+        self.retries = 0
+        self.exhausted = 0
+
+    def record_request(self):
+        self.requests += 1
+        self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        if self._tokens < 1.0:
+            self.exhausted += 1
+            return False
+        self._tokens -= 1.0
+        self.retries += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "tokens": round(self._tokens, 2),
+            "requests": self.requests,
+            "retries": self.retries,
+            "budget_exhausted": self.exhausted,
+        }
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 0.2,
+        max_delay: float = 5.0,
+        max_retry_after: float = 10.0,
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+
+    def is_retryable_status(self, status_code: int) -> bool:
+        return status_code in RETRYABLE_STATUS
+
+    def is_retryable_error(self, error: Exception) -> bool:
+        # Connect/read timeouts, resets and protocol errors; never local refusals
+        return isinstance(error, httpx.TransportError)
+
+    def backoff(self, previous: float) -> float:
+        """
+        Decorrelated jitter: sleep = min(cap, uniform(base, previous * 3)).
+        """
+        return min(self.max_delay, random.uniform(self.base_delay, max(self.base_delay, previous * 3)))
+
+    def delay_for(self, previous: float, response: httpx.Response = None):
+        """
+        Delay before the next attempt, or None if the upstream asked us to
+        wait longer than we are willing to hold the farmer's request.
+        """
+        delay = self.backoff(previous)
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                if retry_after > self.max_retry_after:
+                    return None
+                delay = max(delay, retry_after)
+        return delay
+
+
+policy = RetryPolicy(
+    max_attempts=int(os.getenv("HASIRI_RETRY_MAX_ATTEMPTS", "3")),
+    base_delay=float(os.getenv("HASIRI_RETRY_BASE_DELAY", "0.2")),
+    max_delay=float(os.getenv("HASIRI_RETRY_MAX_DELAY", "5.0")),
+    max_retry_after=float(os.getenv("HASIRI_RETRY_MAX_RETRY_AFTER", "10.0")),
+)
+budget = RetryBudget(
+    ratio=float(os.getenv("HASIRI_RETRY_BUDGET_RATIO", "0.1")),
+    max_tokens=float(os.getenv("HASIRI_RETRY_BUDGET_MAX_TOKENS", "10")),
+)
@@ -0,0 +1,192 @@
+"""
+Sentence segmentation and byte-budget packing for replies in Indian languages.
+
+Hindi, Marathi, Bengali and Punjabi end sentences with the danda (।, ॥), which
+needs no following space; Tamil, Malayalam, Telugu, Kannada, Gujarati and English
+use the Latin full stop, which only ends a sentence before whitespace (not in
+2.5 or after Dr.). Bengali typists often use an ASCII pipe for the danda.
+
+Segments are packed greedily into chunks under a byte budget (a TTS request, an
+SMS part), counting each piece's encoded size once, so the cost is linear in the
+length of the text. Used by TTS chunking and streamed synthesis; any channel
+with a size limit can reuse split_sentences/pack_segments. SentenceBuffer does
+the same splitting incrementally for text that is still being generated.
+"""
+
+import re
+import unicodedata
+
+# A sentence ends after a danda run, a Latin terminator run before whitespace,
+# a pipe used as a danda after non-ASCII text, or a line break. Closing quotes
+# and brackets stay with the sentence they close.
+_BOUNDARY = re.compile(
+    r"[।॥۔]+[\"'”’»)\]]*"
+    r"|[.?!…]+[\"'”’»)\]]*(?=\s|$)"
+    r"|(?<=[^\x00-\x7f])\|(?=\s|$)"
+    r"|\n"
+)
+
+# A full stop after these does not end a sentence: list numbers ("1. "),
+# initials, and common titles and units, in English and in Indic scripts
+_NO_BREAK_BEFORE = re.compile(
+    r"(?<!\S)(?:\d{1,2}|[A-Za-z]|Dr|Mr|Mrs|Ms|Mt|Rs|No|St|Prof|Shri|Smt|Kg|"
+    r"डॉ|श्री|டாக்டர்|திரு|திருமதி|ഡോ|ശ്രീ)\.$"
+)
+
+
+def split_sentences(text: str) -> list:
+    """
+    Split text into sentences, each keeping its own terminator, in one pass.
+    Whitespace around sentences is dropped and empty sentences are skipped.
+    """
+    sentences = []
+    start = 0
+    for match in _BOUNDARY.finditer(text):
+        end = match.end()
+        if text[match.start()] == "." and _NO_BREAK_BEFORE.search(text, max(0, end - 16), end):
+            continue
+        sentence = text[start:end].strip()
+        if sentence:
+            sentences.append(sentence)
+        start = end
+    tail = text[start:].strip()
+    if tail:
+        sentences.append(tail)
+    return sentences
+
+
+class SentenceBuffer:
+    """
+    split_sentences for text that arrives in pieces, such as a streamed reply.
+    feed() returns the sentences completed so far. A terminator at the very end
+    of the text received is held back until the next piece shows what follows
+    it (2.5, a closing quote, another danda). flush() returns the rest.
+    Splitting a text fed in any pieces gives exactly split_sentences(text).
+    """
+
+    def __init__(self):
+        self._text = ""  # Unsplit text, after at most one character of context
+        self._start = 0  # Where the unsplit text begins in _text
+        self._scan = 0   # Where to resume looking for boundaries
+
+    def feed(self, piece: str) -> list:
+        text = self._text + piece
+        sentences = []
+        start = self._start
+        for match in _BOUNDARY.finditer(text, self._scan):
+            end = match.end()
+            if end == len(text):
+                break
+            if text[match.start()] == "." and _NO_BREAK_BEFORE.search(text, max(0, end - 16), end):
+                continue
+            sentence = text[start:end].strip()
+            if sentence:
+                sentences.append(sentence)
+            start = end
+        # Keep one character before the unsplit text for the lookbehinds, and rescan
+        # only the tail, where a held-back terminator run may continue
+        keep = max(0, start - 1)
+        self._text = text[keep:]
+        self._start = start - keep
+        self._scan = max(self._start, len(self._text) - 16)
+        return sentences
+
+    def flush(self) -> list:
+        tail = self._text[self._start:].strip()
+        self._text, self._start, self._scan = "", 0, 0
+        return [tail] if tail else []
+
+
+_JOINERS = "\u200c\u200d"  # ZWNJ, ZWJ
+
+
+def _starts_cluster(word: str, i: int) -> bool:
+    # False inside a syllable: before a vowel sign or other mark, around a
+    # joiner, or right after a virama (which binds the next consonant)
+    return not (
+        unicodedata.category(word[i])[0] == "M"
+        or word[i] in _JOINERS
+        or word[i - 1] in _JOINERS
+        or unicodedata.combining(word[i - 1]) == 9
+    )
+
+
+def _hard_split(word: str, max_bytes: int, encoding: str) -> list:
+    # No usable boundary at all: split on characters, but not inside a syllable
+    pieces = []
+    start = 0
+    size = 0
+    for i, char in enumerate(word):
+        char_bytes = len(char.encode(encoding))
+        if size + char_bytes > max_bytes and i > start:
+            cut = i
+            while cut > start and not _starts_cluster(word, cut):
+                cut -= 1
+            if cut == start or len(word[cut:i + 1].encode(encoding)) > max_bytes:
+                cut = i  # One syllable larger than the whole budget
+            pieces.append(word[start:cut])
+            size = len(word[cut:i].encode(encoding))
+            start = cut
+        size += char_bytes
+    pieces.append(word[start:])
+    return pieces
+
+
+def _fit(segment: str, max_bytes: int, encoding: str, separator: int):
+    """
+    Yield (piece, encoded size) for a segment, splitting one longer than max_bytes
+    at word boundaries, and words longer than max_bytes on characters.
+    """
+    segment_bytes = len(segment.encode(encoding))
+    if segment_bytes <= max_bytes:
+        yield segment, segment_bytes
+        return
+    current = []
+    current_bytes = 0
+    for word in segment.split():
+        word_bytes = len(word.encode(encoding))
+        parts = [(word, word_bytes)]
+        if word_bytes > max_bytes:
+            parts = [(part, len(part.encode(encoding))) for part in _hard_split(word, max_bytes, encoding)]
+        for part, part_bytes in parts:
+            if current and current_bytes + separator + part_bytes > max_bytes:
+                yield " ".join(current), current_bytes
+                current, current_bytes = [], 0
+            current_bytes += part_bytes + (separator if current else 0)
+            current.append(part)
+    if current:
+        yield " ".join(current), current_bytes
+
+
+def pack_segments(segments, max_bytes: int, encoding: str = "utf-8", budgets=()) -> list:
+    """
+    Greedily join segments with spaces into chunks of at most max_bytes when
+    encoded (use a BOM-less encoding, e.g. utf-16-be for UCS-2 SMS parts).
+    budgets optionally gives smaller byte budgets for the first chunks, e.g.
+    (0, 512, 1024) sends the first segment alone and then grows the chunks.
+    Every chunk holds at least one piece; no chunk exceeds max_bytes.
+    """
+    separator = len(" ".encode(encoding))
+    budgets = iter(budgets)
+    budget = min(next(budgets, max_bytes), max_bytes)
+    chunks = []
+    current = []
+    current_bytes = 0
+    for segment in segments:
+        for piece, piece_bytes in _fit(segment, max_bytes, encoding, separator):
+            if current and current_bytes + separator + piece_bytes > budget:
+                chunks.append(" ".join(current))
+                current, current_bytes = [], 0
+                budget = min(next(budgets, max_bytes), max_bytes)
+            current_bytes += piece_bytes + (separator if current else 0)
+            current.append(piece)
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def split_to_budget(text: str, max_bytes: int, encoding: str = "utf-8", budgets=()) -> list:
+    """
+    Split text at sentence boundaries into chunks that each fit in max_bytes.
+    """
+    return pack_segments(split_sentences(text), max_bytes, encoding, budgets)
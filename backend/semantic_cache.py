@@ -0,0 +1,372 @@
+"""
+Semantic near-duplicate cache for chat questions.
+
+Questions are embedded locally on CPU as hashed character n-gram TF-IDF vectors,
+which work the same for every Indic script and for romanized text. Vectors live in
+an in-memory IVF (inverted file) index, one partition per language: a partition is
+searched exhaustively until it is large enough to train k-means centroids, after
+which a query only scans the nprobe closest lists plus the not-yet-indexed tail.
+
+Entries are evicted least-recently-used in batches once a partition is full, and
+the whole cache is saved to / loaded from disk across restarts.
+
+Similar wording is not the same question: "2 acres" and "20 acres", or "leaves
+turning yellow" and "leaves not turning yellow", embed almost identically. Each
+entry keeps the numbers and negation words of its question, and a hit is served
+only when the new question has exactly the same ones. Only the languages the
+cache is created with get a partition (and a file on disk).
+"""
+
+import json
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+import log
+from cache import normalize_question
+
+NGRAM_SIZES = (2, 3, 4)
+
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)*")
+
+# Negation words, and suffixes that negate a Dravidian verb or copula in one word
+NEGATIONS = frozenset({
+    "no", "not", "never", "nor", "none", "nothing", "without", "cannot", "dont", "doesnt",
+    "didnt", "isnt", "arent", "wasnt", "werent", "wont", "cant", "shouldnt", "wouldnt",
+    "nahi", "nahin", "nahī", "mat", "bina", "illa", "illai", "venda",
+    "नहीं", "नही", "न", "मत", "बिना", "नाही", "नको",
+    "না", "নয়", "নেই", "নি", "ছাড়া",
+    "નથી", "ના", "નહીં", "નહિ", "વગર",
+    "ਨਹੀਂ", "ਨਾ", "ਮਤ", "ਬਿਨਾਂ",
+    "இல்லை", "அல்ல", "வேண்டாம்", "இல்லாமல்",
+    "లేదు", "కాదు", "వద్దు", "లేకుండా",
+    "ಇಲ್ಲ", "ಅಲ್ಲ", "ಬೇಡ", "ಇಲ್ಲದೆ",
+    "ഇല്ല", "അല്ല", "വേണ്ട", "ഇല്ലാതെ",
+})
+NEGATION_SUFFIXES = ("n't", "ல்லை", "ாது", "లేదు", "ಲ್ಲ", "ല്ല")
+
+
+def question_guard(text: str) -> str:
+    """
+    The numbers and negation words of a question, in a canonical string.
+    Digits in any script count as their ASCII value; thousands separators are dropped.
+    """
+    text = unicodedata.normalize("NFKC", text).casefold().replace("\u2019", "'")
+    numbers = sorted(
+        "".join(str(unicodedata.decimal(char)) if char.isdecimal() else char for char in match).replace(",", "")
+        for match in _NUMBER.findall(text)
+    )
+    words = "".join(
+        " " if unicodedata.category(char)[0] in ("P", "S") and char != "'" else char
+        for char in text
+    ).split()
+    negations = sorted(
+        word.replace("'", "") for word in words
+        if word.replace("'", "") in NEGATIONS or word.endswith(NEGATION_SUFFIXES)
+    )
+    return f"{' '.join(numbers)}|{' '.join(negations)}"
+
+
+class HashedTfidfEmbedder:
+    """
+    Character n-grams are hashed (crc32, stable across processes) into `dim`
+    signed buckets, weighted by sublinear TF and a running IDF, then L2-normalized.
+    IDF is learned from the questions added to the cache, so stored vectors use the
+    IDF at insertion time; that drift is small once a few hundred questions are in.
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.doc_freq = np.zeros(dim, dtype=np.float64)
+        self.docs = 0
+
+    def _buckets(self, text: str) -> dict:
+        text = f" {normalize_question(text)} "
+        counts = {}
+        for n in NGRAM_SIZES:
+            for i in range(len(text) - n + 1):
+                h = zlib.crc32(text[i:i + n].encode("utf-8"))
+                bucket = h % self.dim
+                sign = 1.0 if (h >> 31) & 1 else -1.0
+                counts[bucket] = counts.get(bucket, 0.0) + sign
+        return counts
+
+    def embed(self, text: str, learn: bool = False) -> np.ndarray:
+        counts = self._buckets(text)
+        if learn:
+            self.docs += 1
+            for bucket in counts:
+                self.doc_freq[bucket] += 1
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for bucket, count in counts.items():
+            idf = math.log((1 + self.docs) / (1 + self.doc_freq[bucket])) + 1.0
+            vector[bucket] = math.copysign(1.0 + math.log(abs(count)), count) * idf if count else 0.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class IVFPartition:
+    """
+    IVF index over unit vectors for one language. Slots [0, indexed) are grouped
+    by centroid in CSR form (order/offsets); slots [indexed, count) are a tail that
+    is scanned exhaustively until the next rebuild.
+    """
+
+    def __init__(self, dim: int, max_entries: int, nprobe: int = 8, train_threshold: int = 4096):
+        self.dim = dim
+        self.max_entries = max_entries
+        self.nprobe = nprobe
+        self.train_threshold = train_threshold
+
+        self.vectors = np.zeros((1024, dim), dtype=np.float32)
+        self.last_used = np.zeros(1024, dtype=np.float64)
+        self.replies = []  # (reply, question guard) per slot
+        self.count = 0
+
+        self.centroids = None
+        self.assignment = np.zeros(1024, dtype=np.int32)
+        self.order = np.zeros(0, dtype=np.int64)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.indexed = 0
+        self.trained_size = 0
+
+    def _grow(self, needed: int):
+        capacity = len(self.vectors)
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2)
+        for name in ("vectors", "last_used", "assignment"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def add_many(self, vectors: np.ndarray, replies: list, last_used: np.ndarray = None):
+        n = len(vectors)
+        if n == 0:
+            return
+        if self.count + n > self.max_entries:
+            self._evict(self.count + n - self.max_entries)
+        self._grow(self.count + n)
+        self.vectors[self.count:self.count + n] = vectors
+        self.last_used[self.count:self.count + n] = time.time() if last_used is None else last_used
+        self.replies.extend(replies)
+        self.count += n
+        self._maybe_reindex()
+
+    def search(self, query: np.ndarray):
+        """
+        Best (slot, cosine similarity) for a unit query vector, or (None, 0.0).
+        """
+        if self.count == 0:
+            return None, 0.0
+        if self.centroids is None:
+            candidates = None
+            scores = self.vectors[:self.count] @ query
+        else:
+            centroid_scores = self.centroids @ query
+            nprobe = min(self.nprobe, len(self.centroids))
+            probe = np.argpartition(centroid_scores, -nprobe)[-nprobe:]
+            ranges = [self.order[self.offsets[p]:self.offsets[p + 1]] for p in probe]
+            ranges.append(np.arange(self.indexed, self.count))
+            candidates = np.concatenate(ranges)
+            if len(candidates) == 0:
+                return None, 0.0
+            scores = self.vectors[candidates] @ query
+        best = int(np.argmax(scores))
+        slot = best if candidates is None else int(candidates[best])
+        return slot, float(scores[best])
+
+    def touch(self, slot: int):
+        self.last_used[slot] = time.time()
+
+    def _evict(self, at_least: int):
+        # Evict in batches of 10% so compaction cost is amortized
+        if self.centroids is not None and self.indexed < self.count:
+            self._assign(self.indexed, self.count)
+        n = min(self.count, max(at_least, self.max_entries // 10))
+        victims = np.argpartition(self.last_used[:self.count], n - 1)[:n] if n < self.count else np.arange(self.count)
+        keep = np.ones(self.count, dtype=bool)
+        keep[victims] = False
+        survivors = np.flatnonzero(keep)
+        kept = len(survivors)
+        self.vectors[:kept] = self.vectors[survivors]
+        self.last_used[:kept] = self.last_used[survivors]
+        self.assignment[:kept] = self.assignment[survivors]
+        self.replies = [self.replies[i] for i in survivors]
+        self.count = kept
+        self.indexed = 0
+        self._rebuild_lists()
+
+    def _maybe_reindex(self):
+        if self.count < self.train_threshold:
+            return
+        if self.centroids is None or self.count >= 2 * self.trained_size:
+            self._train()
+        elif self.count - self.indexed > max(1024, self.count // 10):
+            self._assign(self.indexed, self.count)
+            self._rebuild_lists()
+
+    def _train(self, iterations: int = 10):
+        nlist = max(16, int(math.sqrt(self.count)))
+        rng = np.random.default_rng(0)
+        sample_size = min(self.count, nlist * 64)
+        sample = self.vectors[rng.choice(self.count, sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(iterations):
+            nearest = np.argmax(sample @ centroids.T, axis=1)
+            order = np.argsort(nearest, kind="stable")
+            present, starts = np.unique(nearest[order], return_index=True)
+            centroids[present] = np.add.reduceat(sample[order], starts, axis=0)
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            centroids /= np.where(norms == 0, 1, norms)
+        self.centroids = centroids
+        self.trained_size = self.count
+        self._assign(0, self.count)
+        self._rebuild_lists()
+
+    def _assign(self, start: int, end: int, batch: int = 65536):
+        for lo in range(start, end, batch):
+            hi = min(end, lo + batch)
+            self.assignment[lo:hi] = np.argmax(self.vectors[lo:hi] @ self.centroids.T, axis=1)
+
+    def _rebuild_lists(self):
+        if self.centroids is None:
+            return
+        assignment = self.assignment[:self.count]
+        self.order = np.argsort(assignment, kind="stable")
+        counts = np.bincount(assignment, minlength=len(self.centroids))
+        self.offsets = np.concatenate(([0], np.cumsum(counts)))
+        self.indexed = self.count
+
+
+class SemanticCache:
+    def __init__(
+        self,
+        languages,
+        threshold: float = 0.9,
+        dim: int = 256,
+        max_entries: int = 100_000,
+        nprobe: int = 8,
+        path: Path = None,
+    ):
+        self.languages = frozenset(languages)
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.nprobe = nprobe
+        self.path = path
+        self.embedder = HashedTfidfEmbedder(dim)
+        self.partitions = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.guard_rejects = 0
+
+    def _partition(self, language: str) -> IVFPartition:
+        partition = self.partitions.get(language)
+        if partition is None:
+            partition = IVFPartition(self.embedder.dim, self.max_entries, self.nprobe)
+            self.partitions[language] = partition
+        return partition
+
+    def lookup(self, text: str, language: str):
+        """
+        Return (reply, similarity) for the closest cached question in this
+        language if it clears the threshold and has the same numbers and
+        negations, else (None, similarity).
+        Blocking; call through asyncio.to_thread from request handlers.
+        """
+        with self._lock:
+            partition = self.partitions.get(language)
+            if partition is None:
+                self.misses += 1
+                return None, 0.0
+            slot, similarity = partition.search(self.embedder.embed(text))
+            if slot is None or similarity < self.threshold:
+                self.misses += 1
+                return None, similarity
+            reply, guard = partition.replies[slot]
+            if guard != question_guard(text):
+                self.misses += 1
+                self.guard_rejects += 1
+                return None, similarity
+            partition.touch(slot)
+            self.hits += 1
+            return reply, similarity
+
+    def add(self, text: str, language: str, reply: str):
+        if language not in self.languages:
+            return
+        with self._lock:
+            vector = self.embedder.embed(text, learn=True)
+            self._partition(language).add_many(vector[None, :], [(reply, question_guard(text))])
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            self.path.mkdir(parents=True, exist_ok=True)
+            np.savez(self.path / "embedder.npz", doc_freq=self.embedder.doc_freq, docs=self.embedder.docs)
+            for language, partition in self.partitions.items():
+                np.savez(
+                    self.path / f"{language}.npz",
+                    vectors=partition.vectors[:partition.count],
+                    last_used=partition.last_used[:partition.count],
+                )
+                with open(self.path / f"{language}.json", "w", encoding="utf-8") as f:
+                    json.dump(partition.replies, f, ensure_ascii=False)
+        log.info("semantic_cache.saved", entries=sum(p.count for p in self.partitions.values()))
+
+    def load(self):
+        if not self.path or not (self.path / "embedder.npz").exists():
+            return
+        with self._lock:
+            state = np.load(self.path / "embedder.npz")
+            if len(state["doc_freq"]) != self.embedder.dim:
+                log.warning("semantic_cache.dimension_mismatch", dim=len(state["doc_freq"]), expected=self.embedder.dim)
+                return
+            self.embedder.doc_freq = state["doc_freq"]
+            self.embedder.docs = int(state["docs"])
+            self.partitions = {}
+            for vectors_file in self.path.glob("*.npz"):
+                if vectors_file.stem not in self.languages:
+                    continue
+                arrays = np.load(vectors_file)
+                with open(vectors_file.with_suffix(".json"), encoding="utf-8") as f:
+                    entries = json.load(f)
+                if entries and isinstance(entries[0], str):
+                    # Saved before question guards; a hit could not be checked
+                    log.warning("semantic_cache.outdated_partition", language=vectors_file.stem)
+                    continue
+                replies = [tuple(entry) for entry in entries]
+                self._partition(vectors_file.stem).add_many(arrays["vectors"], replies, arrays["last_used"])
+        log.info("semantic_cache.loaded", entries=sum(p.count for p in self.partitions.values()))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": {language: p.count for language, p in self.partitions.items()},
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "guard_rejects": self.guard_rejects,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+def from_env(cache_dir: Path, languages) -> SemanticCache:
+    return SemanticCache(
+        languages,
+        threshold=float(os.getenv("HASIRI_SEMANTIC_CACHE_THRESHOLD", "0.9")),
+        max_entries=int(os.getenv("HASIRI_SEMANTIC_CACHE_MAX_ENTRIES", "100000")),
+        nprobe=int(os.getenv("HASIRI_SEMANTIC_CACHE_NPROBE", "8")),
+        path=cache_dir / "semantic",
+    )
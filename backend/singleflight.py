@@ -0,0 +1,62 @@
+"""
+Single-flight coalescing of identical concurrent upstream calls.
+
+Concurrent callers with the same canonical key share one in-flight task and all
+receive its result or its exception. The shared task runs independently of any one
+caller, so a farmer disconnecting does not fail everybody else waiting on the same
+answer; it is only cancelled once every waiter has gone away.
+"""
+
+import asyncio
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}
+
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn):
+        """
+        Run fn() (a zero-argument coroutine function) unless an identical call
+        is already in flight, in which case wait for that one instead.
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _, key=key, call=call: self._forget(key, call))
+            self.executed += 1
+        else:
+            self.coalesced += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Everybody who wanted this result is gone
+                self._forget(key, call)
+                call.task.cancel()
+
+    def _forget(self, key: str, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls),
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+        }
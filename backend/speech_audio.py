@@ -0,0 +1,402 @@
+"""
+Server-side audio preparation for speech recognition.
+
+Recordings are decoded to 16-bit mono PCM (WAV with the wave module, anything
+else through ffmpeg when it is installed) and run through a cheap energy and
+zero-crossing-rate voice activity detector. Leading and trailing silence is
+trimmed before upload, and clips with no speech at all never reach the Speech
+API. Audio that cannot be decoded here is passed through untouched.
+
+The container is identified from its header bytes (WAV, FLAC, Ogg, WebM, MP4,
+ADTS AAC, MP3, AMR), which gives the recognition encoding and sample rate for the
+formats the Speech API accepts. Other formats are transcoded to LINEAR16 with
+ffmpeg, and anything unrecognizable is rejected without an upstream call.
+
+Recordings longer than one synchronous recognize call allows are cut at pauses
+into overlapping segments; each segment keeps the words that start inside its
+own (non-overlapping) span, so stitching by word time offsets drops duplicates.
+"""
+
+import asyncio
+import io
+import shutil
+import struct
+import wave
+from dataclasses import dataclass
+
+import numpy as np
+
+FFMPEG = shutil.which("ffmpeg")
+DECODE_SAMPLE_RATE = 16000
+DECODE_TIMEOUT = 15
+
+FRAME_SECONDS = 0.03
+PADDING_SECONDS = 0.25      # Kept around speech so word onsets/endings are not clipped
+MIN_SPEECH_SECONDS = 0.1    # Less than this in total counts as silence
+MIN_SAVING_SECONDS = 0.3    # Smaller savings are not worth re-encoding the upload
+
+# Sample rates the Speech API accepts for Opus; Opus always decodes at 48 kHz otherwise
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+
+
+@dataclass
+class AudioInfo:
+    container: str          # wav, flac, ogg, webm, mp4, aac, mp3, amr
+    encoding: str = None    # Speech API encoding; None when it needs transcoding
+    sample_rate: int = None
+    channels: int = 1
+
+
+@dataclass
+class PreparedAudio:
+    audio_bytes: bytes
+    encoding: str = None        # None: send as received, with the default config
+    sample_rate: int = None
+    silent: bool = False
+    seconds_saved: float = 0.0
+    samples: np.ndarray = None  # Decoded speech (after trimming), when decodable
+    samples_rate: int = None
+    error: str = None           # Set when the audio was rejected locally
+
+    @property
+    def duration(self) -> float:
+        return len(self.samples) / self.samples_rate if self.samples is not None else 0.0
+
+
+@dataclass
+class Segment:
+    start: int          # Sample range sent for recognition, including overlap
+    end: int
+    keep_start: float   # Seconds (from the start of the recording) this segment is authoritative for
+    keep_end: float
+    sample_rate: int = DECODE_SAMPLE_RATE
+
+    @property
+    def offset(self) -> float:
+        return self.start / self.sample_rate
+
+
+def sniff_wav(audio_bytes: bytes):
+    position = 12
+    while position + 8 <= len(audio_bytes):
+        chunk_id = audio_bytes[position:position + 4]
+        (size,) = struct.unpack("<I", audio_bytes[position + 4:position + 8])
+        if chunk_id == b"fmt ":
+            if size < 16 or position + 24 > len(audio_bytes):
+                return None
+            fmt, channels, sample_rate, _, _, bits = struct.unpack("<HHIIHH", audio_bytes[position + 8:position + 24])
+            if fmt == 0xFFFE and size >= 40:  # WAVE_FORMAT_EXTENSIBLE: real format in the subformat GUID
+                if position + 34 > len(audio_bytes):
+                    return None
+                (fmt,) = struct.unpack("<H", audio_bytes[position + 32:position + 34])
+            if not sample_rate or not channels:
+                return None
+            encoding = {(1, 16): "LINEAR16", (7, 8): "MULAW"}.get((fmt, bits))
+            return AudioInfo("wav", encoding, sample_rate, channels)
+        position += 8 + size + (size & 1)
+    return None
+
+
+def sniff_flac(audio_bytes: bytes):
+    # STREAMINFO is always the first metadata block: 20-bit sample rate, 3-bit channels - 1
+    if len(audio_bytes) < 26 or audio_bytes[4] & 0x7F != 0:
+        return None
+    packed = int.from_bytes(audio_bytes[18:21], "big")
+    sample_rate, channels = packed >> 4, ((packed >> 1) & 0x7) + 1
+    return AudioInfo("flac", "FLAC", sample_rate, channels) if sample_rate else None
+
+
+def sniff_ogg(audio_bytes: bytes):
+    # First page: 27-byte header, segment table, then the codec's identification packet
+    if len(audio_bytes) < 28:
+        return None
+    payload = 27 + audio_bytes[26]
+    packet = audio_bytes[payload:payload + 19]
+    if packet[:8] == b"OpusHead" and len(packet) >= 16:
+        (input_rate,) = struct.unpack("<I", packet[12:16])
+        sample_rate = input_rate if input_rate in OPUS_SAMPLE_RATES else 48000
+        return AudioInfo("ogg", "OGG_OPUS", sample_rate, packet[9])
+    if len(packet) < 19:
+        return None
+    return AudioInfo("ogg")  # Vorbis, Speex, Ogg FLAC: transcode
+
+
+def ebml_number(data: bytes, position: int, keep_marker: bool):
+    """
+    (value, next position) of the EBML variable-length integer at position.
+    Sizes of all ones (unknown size, used by live recorders) come back as -1.
+    """
+    if position >= len(data) or data[position] == 0:
+        return None, len(data)
+    length = 9 - data[position].bit_length()
+    raw = data[position:position + length]
+    if len(raw) < length:
+        return None, len(data)
+    value = int.from_bytes(raw, "big")
+    if keep_marker:
+        return value, position + length
+    value &= (1 << (7 * length)) - 1
+    return (-1 if value == (1 << (7 * length)) - 1 else value), position + length
+
+
+# Matroska element IDs walked to reach the audio track
+EBML_SEGMENT, EBML_TRACKS, EBML_TRACK_ENTRY, EBML_AUDIO = 0x18538067, 0x1654AE6B, 0xAE, 0xE1
+EBML_CLUSTER, EBML_CODEC_ID, EBML_SAMPLING_FREQUENCY, EBML_CHANNELS = 0x1F43B675, 0x86, 0xB5, 0x9F
+
+
+def sniff_webm(audio_bytes: bytes):
+    """
+    Walk the EBML tree down Segment > Tracks > TrackEntry to the codec and the
+    Audio element. Tracks precede the first Cluster, so only the header is read.
+    """
+    codec, sample_rate, channels = None, None, 1
+    position = 0
+    while position < len(audio_bytes):
+        element_id, position = ebml_number(audio_bytes, position, keep_marker=True)
+        size, position = ebml_number(audio_bytes, position, keep_marker=False)
+        if element_id is None or size is None or element_id == EBML_CLUSTER:
+            break
+        if element_id in (EBML_SEGMENT, EBML_TRACKS, EBML_TRACK_ENTRY, EBML_AUDIO):
+            continue  # Descend into the element's children
+        if size < 0:
+            break
+        value = audio_bytes[position:position + size]
+        if element_id == EBML_CODEC_ID and codec is None:
+            codec = value.decode("ascii", "replace").rstrip("\0")
+        elif element_id == EBML_SAMPLING_FREQUENCY and size in (4, 8):
+            sample_rate = int(struct.unpack(">f" if size == 4 else ">d", value)[0])
+        elif element_id == EBML_CHANNELS:
+            channels = int.from_bytes(value, "big") or 1
+        position += size
+    if codec is None:
+        return None
+    if codec == "A_OPUS":
+        return AudioInfo("webm", "WEBM_OPUS", sample_rate if sample_rate in OPUS_SAMPLE_RATES else 48000, channels)
+    return AudioInfo("webm", None, sample_rate, channels)
+
+
+def sniff_audio(audio_bytes: bytes):
+    """
+    AudioInfo for the container in the first bytes of an upload, or None when it
+    is not an audio format we know (or its header is truncated). Header parsing
+    only: nothing is decoded.
+    """
+    head = audio_bytes[:12]
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return sniff_wav(audio_bytes)
+    if head[:4] == b"fLaC":
+        return sniff_flac(audio_bytes)
+    if head[:4] == b"OggS":
+        return sniff_ogg(audio_bytes)
+    if head[:4] == b"\x1aE\xdf\xa3":
+        return sniff_webm(audio_bytes)
+    if head[4:8] == b"ftyp":
+        return AudioInfo("mp4")
+    if head.startswith(b"#!AMR-WB\n"):
+        return AudioInfo("amr", "AMR_WB", 16000)
+    if head.startswith(b"#!AMR\n"):
+        return AudioInfo("amr", "AMR", 8000)
+    if head[:3] == b"ID3":
+        return AudioInfo("mp3")
+    if len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+        # Frame sync: layer bits 00 mark ADTS AAC (raw .aac recordings), others MPEG audio
+        return AudioInfo("aac" if head[1] & 0x06 == 0 else "mp3")
+    return None
+
+
+def wrap_wav(audio_bytes: bytes, encoding: str, sample_rate: int) -> bytes:
+    """
+    Headerless mono LINEAR16 or MULAW samples as a WAV file, so they can be sniffed
+    and decoded like an upload.
+    """
+    fmt, bits = {"LINEAR16": (1, 16), "MULAW": (7, 8)}[encoding]
+    block = bits // 8
+    header = struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + len(audio_bytes), b"WAVE",
+        b"fmt ", 16, fmt, 1, sample_rate, sample_rate * block, block, bits,
+        b"data", len(audio_bytes),
+    )
+    return header + audio_bytes
+
+
+def decode_wav(audio_bytes: bytes):
+    """
+    (int16 mono samples, sample rate) for 16-bit PCM WAV, else None.
+    """
+    try:
+        with wave.open(io.BytesIO(audio_bytes)) as wav:
+            if wav.getsampwidth() != 2 or wav.getcomptype() != "NONE":
+                return None
+            channels = wav.getnchannels()
+            sample_rate = wav.getframerate()
+            samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype="<i2")
+    except (wave.Error, EOFError):
+        return None
+    if channels > 1:
+        samples = samples[:len(samples) - len(samples) % channels]
+        samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+    return samples, sample_rate
+
+
+async def decode_ffmpeg(audio_bytes: bytes, sample_rate: int = DECODE_SAMPLE_RATE):
+    """
+    (int16 mono samples, sample rate) decoded by ffmpeg, or None if ffmpeg is
+    missing or cannot decode the audio.
+    """
+    if not FFMPEG:
+        return None
+    process = await asyncio.create_subprocess_exec(
+        FFMPEG, "-nostdin", "-loglevel", "error", "-i", "pipe:0",
+        "-f", "s16le", "-ac", "1", "-ar", str(sample_rate), "pipe:1",
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        pcm, _ = await asyncio.wait_for(process.communicate(audio_bytes), DECODE_TIMEOUT)
+    except asyncio.TimeoutError:
+        return None
+    finally:
+        if process.returncode is None:
+            # Timed out, or the request was cancelled: don't leave ffmpeg running
+            process.kill()
+            await process.wait()  # Reap the child
+    if process.returncode != 0 or not pcm:
+        return None
+    return np.frombuffer(pcm[:len(pcm) - len(pcm) % 2], dtype="<i2"), sample_rate
+
+
+async def decode_pcm(audio_bytes: bytes):
+    if audio_bytes[:4] == b"RIFF" and audio_bytes[8:12] == b"WAVE":
+        decoded = decode_wav(audio_bytes)
+        if decoded is not None:
+            return decoded
+    return await decode_ffmpeg(audio_bytes)
+
+
+def speech_frames(samples: np.ndarray, sample_rate: int) -> np.ndarray:
+    """
+    Boolean speech flag per FRAME_SECONDS frame. A frame is speech when its energy
+    clears an adaptive threshold above the clip's noise floor, or when it is a
+    little quieter but has the high zero-crossing rate of a fricative (s, sh, f).
+    """
+    frame = max(1, int(sample_rate * FRAME_SECONDS))
+    count = len(samples) // frame
+    if count == 0:
+        return np.zeros(0, dtype=bool)
+    frames = samples[:count * frame].astype(np.float32).reshape(count, frame) / 32768.0
+    energy_db = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+    zcr = np.mean(np.abs(np.diff(np.signbit(frames), axis=1)), axis=1)
+
+    noise_floor = np.percentile(energy_db, 10)
+    # Anything louder than -30 dBFS counts, so a clip that is speech from end to
+    # end (no quiet frames to learn the floor from) is never mistaken for silence
+    threshold = min(max(noise_floor + 12, -55.0), -30.0)
+    weak_threshold = min(max(noise_floor + 6, -60.0), -36.0)
+    return (energy_db > threshold) | ((energy_db > weak_threshold) & (zcr > 0.25))
+
+
+def speech_bounds(samples: np.ndarray, sample_rate: int):
+    """
+    (first, last) sample of detected speech including padding, or None for silence.
+    """
+    flags = speech_frames(samples, sample_rate)
+    frame = max(1, int(sample_rate * FRAME_SECONDS))
+    if flags.sum() * FRAME_SECONDS < MIN_SPEECH_SECONDS:
+        return None
+    speech = np.flatnonzero(flags)
+    padding = int(PADDING_SECONDS * sample_rate)
+    first = max(0, speech[0] * frame - padding)
+    last = min(len(samples), (speech[-1] + 1) * frame + padding)
+    return first, last
+
+
+async def prepare_for_stt(audio_bytes: bytes, vad: bool = True) -> PreparedAudio:
+    """
+    Work out how to send an upload to the Speech API. Formats the API accepts go
+    as received with the encoding and sample rate from their header; others are
+    transcoded to LINEAR16. Audio is decoded whenever possible, VAD or not, so the
+    samples (and duration) are there for splitting long recordings. With vad,
+    leading/trailing silence is trimmed (when that saves enough) and silent clips
+    are flagged. Unknown or undecodable audio comes back with error set.
+    """
+    info = sniff_audio(audio_bytes)
+    if info is None:
+        return PreparedAudio(b"", error="Unrecognized or corrupt audio file")
+    if info.channels > 1:
+        info.encoding = None  # Downmix to mono LINEAR16
+    decoded = await decode_pcm(audio_bytes)
+    if decoded is None:
+        if info.encoding is None:
+            reason = "could not be decoded" if FFMPEG else "needs transcoding, but ffmpeg is not installed"
+            return PreparedAudio(b"", error=f"Unsupported {info.container} audio: {reason}")
+        return PreparedAudio(audio_bytes, info.encoding, info.sample_rate)
+    samples, sample_rate = decoded
+    seconds_saved = 0.0
+    if vad:
+        duration = len(samples) / sample_rate
+        bounds = await asyncio.to_thread(speech_bounds, samples, sample_rate)
+        if bounds is None:
+            return PreparedAudio(b"", silent=True, seconds_saved=duration)
+        first, last = bounds
+        seconds_saved = duration - (last - first) / sample_rate
+    if seconds_saved < MIN_SAVING_SECONDS:
+        if info.encoding:
+            return PreparedAudio(audio_bytes, info.encoding, info.sample_rate, samples=samples, samples_rate=sample_rate)
+        return PreparedAudio(samples.astype("<i2").tobytes(), "LINEAR16", sample_rate, samples=samples, samples_rate=sample_rate)
+    samples = samples[first:last]
+    return PreparedAudio(
+        samples.astype("<i2").tobytes(),
+        encoding="LINEAR16",
+        sample_rate=sample_rate,
+        seconds_saved=seconds_saved,
+        samples=samples,
+        samples_rate=sample_rate,
+    )
+
+
+def split_segments(samples: np.ndarray, sample_rate: int, max_seconds: float, overlap_seconds: float) -> list:
+    """
+    Cut a long recording into Segments of at most max_seconds including overlap on
+    both sides. Each cut goes in the latest pause of at least 0.2 s in the second half
+    of the allowed span, else at any quiet frame, else (speech throughout) at the limit.
+    """
+    flags = speech_frames(samples, sample_rate)
+    frame = max(1, int(sample_rate * FRAME_SECONDS))
+    max_frames = max(1, int((max_seconds - 2 * overlap_seconds) / FRAME_SECONDS))
+    pause_frames = max(1, int(0.2 / FRAME_SECONDS))
+    cuts = [0]
+    while len(flags) - cuts[-1] > max_frames:
+        low, high = cuts[-1] + max_frames // 2, cuts[-1] + max_frames
+        quiet = ~flags[low:high]
+        in_pause = np.convolve(quiet, np.ones(pause_frames), mode="same") >= pause_frames
+        candidates = np.flatnonzero(in_pause)
+        if len(candidates) == 0:
+            candidates = np.flatnonzero(quiet)
+        cuts.append(low + int(candidates[-1]) if len(candidates) else high)
+    overlap = int(overlap_seconds * sample_rate)
+    bounds = [cut * frame for cut in cuts] + [len(samples)]
+    segments = []
+    for keep_start, keep_end in zip(bounds, bounds[1:]):
+        segments.append(Segment(
+            start=max(0, keep_start - overlap),
+            end=min(len(samples), keep_end + overlap),
+            keep_start=keep_start / sample_rate,
+            keep_end=keep_end / sample_rate if keep_end < len(samples) else float("inf"),
+            sample_rate=sample_rate,
+        ))
+    return segments
+
+
+def stitch_words(segments: list, segment_words: list) -> list:
+    """
+    Merge per-segment words, given as (start seconds within the segment, word),
+    keeping each word only in the segment whose own span contains its start.
+    """
+    words = []
+    for segment, timed_words in zip(segments, segment_words):
+        for start, word in timed_words:
+            if segment.keep_start <= segment.offset + start < segment.keep_end:
+                words.append(word)
+    return words
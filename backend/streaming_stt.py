@@ -0,0 +1,154 @@
+"""
+Streaming speech recognition behind a small interface.
+
+A recognizer consumes audio frames as the farmer speaks and yields transcript
+events: {"type": "interim" | "final", "transcript": ..., "languageCode": ...}.
+IncrementalRecognizer builds streaming on top of a one-shot recognize call (the
+REST API has no streaming method): while audio arrives it re-recognizes it every
+few seconds for an interim transcript (a bounded trailing window of raw samples;
+container formats only while the whole recording fits that bound), then recognizes
+the whole recording once for the final result (reusing the last interim when that
+already covered it). LocalRecognizer is a stand-in with no upstream
+at all, for tests and offline development.
+"""
+
+import asyncio
+import os
+import time
+from abc import ABC, abstractmethod
+
+import log
+
+# Headerless sample streams; any slice of them is still decodable
+RAW_ENCODINGS = {"LINEAR16", "MULAW"}
+
+
+class StreamingRecognizer(ABC):
+    @abstractmethod
+    def recognize(self, frames, config: dict):
+        """
+        Async generator: consume `frames` (an async iterable of audio bytes, ending
+        when the client stops sending) and yield interim events, then one final event.
+        """
+
+
+class IncrementalRecognizer(StreamingRecognizer):
+    def __init__(
+        self,
+        recognize_once,
+        interval: float = 1.5,
+        max_interim: int = 8,
+        window_bytes: int = 256 * 1024,
+        recognize_final=None,
+    ):
+        """
+        recognize_once(audio_bytes, config) -> (transcript, languageCode) is a coroutine
+        that recognizes a recording. At most one interim recognition runs at a time, at
+        least `interval` seconds apart, and at most `max_interim` per stream. Each sends
+        at most `window_bytes` of audio: the last whole frames for RAW_ENCODINGS, and
+        the whole recording for container formats, whose later frames cannot be decoded
+        without the ones before them, so their interims stop once it outgrows the window.
+        recognize_final, with the same signature, recognizes the whole recording at the
+        end; it defaults to recognize_once.
+        """
+        self.recognize_once = recognize_once
+        self.interval = interval
+        self.max_interim = max_interim
+        self.window_bytes = window_bytes
+        self.recognize_final = recognize_final or recognize_once
+
+    def _window(self, chunks: list) -> bytes:
+        tail = []
+        size = 0
+        for chunk in reversed(chunks):
+            if tail and size + len(chunk) > self.window_bytes:
+                break
+            tail.append(chunk)
+            size += len(chunk)
+        return b"".join(tail[::-1])
+
+    async def recognize(self, frames, config: dict):
+        chunks = []
+        received = 0
+        raw = config.get("encoding") in RAW_ENCODINGS
+        arrived = asyncio.Event()
+        ended = False
+
+        async def receive():
+            nonlocal ended, received
+            try:
+                async for frame in frames:
+                    chunks.append(frame)
+                    received += len(frame)
+                    arrived.set()
+            finally:
+                ended = True
+                arrived.set()
+
+        receiver = asyncio.create_task(receive())
+        recognized_bytes = 0
+        result = None  # (transcript, languageCode) for the last interim window
+        covered = False  # Whether that window was the whole recording so far
+        interims = 0
+        try:
+            while not ended:
+                await arrived.wait()
+                arrived.clear()
+                if ended or interims >= self.max_interim or received == recognized_bytes:
+                    continue
+                if not raw and received > self.window_bytes:
+                    continue  # Too long to resend whole; wait for the final
+                started = time.monotonic()
+                previous = result
+                recognized_bytes = received
+                window = self._window(chunks) if raw else b"".join(chunks)
+                covered = len(window) == received
+                interims += 1
+                try:
+                    result = await self.recognize_once(window, config)
+                except Exception as e:
+                    # Interims are best effort; keep receiving so the final still runs
+                    log.warning("stt_stream.interim_failed", error=str(e) or type(e).__name__)
+                    result, covered = previous, False
+                else:
+                    if result[0] and result != previous:
+                        yield {"type": "interim", "transcript": result[0], "languageCode": result[1]}
+                # Pace interim calls; audio keeps accumulating meanwhile
+                delay = self.interval - (time.monotonic() - started)
+                if delay > 0:
+                    await asyncio.wait({receiver}, timeout=delay)
+            await receiver
+            if result is None or not covered or received != recognized_bytes:
+                # The last interim did not cover the whole recording
+                audio = b"".join(chunks)
+                result = await self.recognize_final(audio, config) if audio else ("", config.get("languageCode"))
+            yield {"type": "final", "transcript": result[0], "languageCode": result[1]}
+        finally:
+            receiver.cancel()
+
+
+class LocalRecognizer(StreamingRecognizer):
+    """
+    Test stand-in: frames are UTF-8 text instead of audio. Each frame extends the
+    interim transcript, and the language is the one the client configured.
+    """
+
+    async def recognize(self, frames, config: dict):
+        words = []
+        languageCode = config.get("languageCode", "en-US")
+        async for frame in frames:
+            words.append(frame.decode("utf-8", "replace").strip())
+            yield {"type": "interim", "transcript": " ".join(words), "languageCode": languageCode}
+        yield {"type": "final", "transcript": " ".join(words), "languageCode": languageCode}
+
+
+def from_env(recognize_once, recognize_final=None) -> StreamingRecognizer:
+    if os.getenv("HASIRI_STT_RECOGNIZER", "google") == "local":
+        return LocalRecognizer()
+    return IncrementalRecognizer(
+        recognize_once,
+        interval=float(os.getenv("HASIRI_STT_INTERIM_INTERVAL", "1.5")),
+        max_interim=int(os.getenv("HASIRI_STT_MAX_INTERIM", "8")),
+        window_bytes=int(os.getenv("HASIRI_STT_INTERIM_WINDOW_BYTES", str(256 * 1024))),
+        recognize_final=recognize_final,
+    )
@@ -0,0 +1,62 @@
+"""
+Test the streaming speech-to-text WebSocket against the local stand-in recognizer
+No Google credentials or audio needed: LocalRecognizer treats each frame as text,
+and IncrementalRecognizer is driven by a fake one-shot recognize call.
+"""
+
+import asyncio
+import os
+import tempfile
+
+os.environ["HASIRI_STT_RECOGNIZER"] = "local"
+os.environ["HASIRI_CACHE_DIR"] = tempfile.mkdtemp()
+os.environ.setdefault("GEMINI_API_KEY", "test")
+os.environ.setdefault("GOOGLE_SPEECH_API_KEY", "test")
+
+from fastapi.testclient import TestClient
+
+import main
+from streaming_stt import IncrementalRecognizer
+
+print("🧪 Testing streaming speech-to-text\n")
+print("=" * 60)
+
+with TestClient(main.app) as client:
+    with client.websocket_connect("/speech-to-text/stream?encoding=LINEAR16&sampleRateHertz=16000") as ws:
+        for word in ["நெல்", "பயிருக்கு", "உரம்"]:
+            ws.send_bytes(word.encode("utf-8"))
+            print(f"📨 Interim: {ws.receive_json()}")
+        ws.send_text("end")
+        final = ws.receive_json()
+        print(f"📨 Final:   {final}")
+        assert final["type"] == "final" and final["transcript"] == "நெல் பயிருக்கு உரம்"
+print("-" * 60)
+
+
+async def incremental():
+    calls = []
+
+    async def recognize_once(audio_bytes, config):
+        calls.append(len(audio_bytes))
+        await asyncio.sleep(0.05)
+        return audio_bytes.decode("utf-8"), "ta-IN"
+
+    async def frames():
+        for word in ["வணக்கம் ", "விவசாயி ", "நண்பரே"]:
+            yield word.encode("utf-8")
+            await asyncio.sleep(0.2)
+
+    recognizer = IncrementalRecognizer(recognize_once, interval=0.1)
+    events = [event async for event in recognizer.recognize(frames(), {"languageCode": "en-US"})]
+    for event in events:
+        print(f"📨 {event['type']:>7}: {event['transcript']} ({event['languageCode']})")
+    print(f"🔁 Upstream recognitions: {len(calls)} (audio bytes per call: {calls})")
+    assert events[-1]["type"] == "final" and events[-1]["transcript"] == "வணக்கம் விவசாயி நண்பரே"
+    # The last interim already covered the whole recording, so the final reused it
+    assert len(calls) == 3
+
+
+asyncio.run(incremental())
+
+print("\n✅ Interim transcripts arrive while audio is still being sent")
+print("✅ The final transcript reuses the last interim when no audio came after it")
@@ -0,0 +1,109 @@
+"""
+Text preparation for Text-to-Speech.
+
+clean_text_for_tts used to run ~35 uncompiled re.sub calls in sequence, each
+scanning and copying the whole reply even when its rule could not apply. The
+patterns are now precompiled, the single-character symbol rules share one
+character class, the four repeated-punctuation rules share one pattern, and
+passes whose trigger characters do not occur in the text are skipped. Rules
+whose output feeds the next one keep their original order, so the output is
+byte-identical to the original implementation (see tts_cleaning_golden.json).
+"""
+
+import re
+
+# Markdown emphasis and code; order-dependent, so each stays its own pass
+_BOLD_STAR = re.compile(r'\*\*([^*]+)\*\*')      # Bold **text**
+_ITALIC_STAR = re.compile(r'\*([^*]+)\*')        # Italic *text*
+_BOLD_UNDERSCORE = re.compile(r'__([^_]+)__')    # Bold __text__
+_ITALIC_UNDERSCORE = re.compile(r'_([^_]+)_')    # Italic _text_
+_INLINE_CODE = re.compile(r'`([^`]+)`')          # Code `text`
+_CODE_BLOCK = re.compile(r'```[^`]*```')         # Code blocks
+
+# Bullets, list markers and headers at a line start. The patterns eat trailing
+# whitespace including newlines, so each one can expose a new line start for the
+# next; they stay separate passes, each skipped unless its marker occurs.
+_UNICODE_BULLETS = re.compile(r'^[\s]*[•·▪▫‣⁃]\s*', re.MULTILINE)
+_UNICODE_BULLET_CHARS = frozenset('•·▪▫‣⁃')
+_ASCII_BULLETS = re.compile(r'^[\s]*[-*+]\s*', re.MULTILINE)
+_ASCII_BULLET_CHARS = frozenset('-*+')
+_NUMBERED_LIST = re.compile(r'^[\s]*\d+\.\s*', re.MULTILINE)
+_HEADERS = re.compile(r'^#+\s*', re.MULTILINE)
+
+# Links
+_MARKDOWN_LINK = re.compile(r'\[([^\]]+)\]\([^)]+\)')   # [text](url)
+_RAW_URL = re.compile(r'https?://[^\s]+')               # Raw URLs
+
+# Symbols that might be pronounced: special characters, arrows, check marks,
+# copyright and currency symbols are dropped in one pass; temperature is spoken
+_SYMBOLS = re.compile(r'[#@$%^&*(){}[\]|\\<>→←↑↓⟹⟸⟷✓✗✘✔✕©®™₹£€¥]')
+_TEMPERATURE = re.compile(r'[°℃℉]')
+
+# Excessive punctuation: runs of . - ! ? collapse to one character
+_REPEATED_PUNCTUATION = re.compile(r'([.\-!?])\1+')
+
+# Separators to natural pauses (pipes were already removed with the symbols)
+_DASHES = re.compile(r'[-–—]')
+
+# Common abbreviations that might be mispronounced. A replacement can create or
+# remove a word boundary for the next rule, so these stay sequential. Each pattern
+# is `\b(etc\.?)\b` with IGNORECASE spelled out as character classes (including
+# the non-ASCII letters IGNORECASE folds onto i and s) and the leading \b moved
+# into a lookbehind, which lets the regex engine skip ahead to candidate letters.
+_ABBREVIATIONS = [
+    (re.compile(r'[Ee](?<!\w[Ee])[Tt][Cc]\.?\b'), 'and so on'),
+    (re.compile(r'[Iiİı](?<!\w[Iiİı])\.[Ee]\.?\b'), 'that is'),
+    (re.compile(r'[Ee](?<!\w[Ee])\.[Gg]\.?\b'), 'for example'),
+    (re.compile(r'[Vv](?<!\w[Vv])[Ssſ]\.?\b'), 'versus'),
+]
+
+def clean_text_for_tts(text: str, line_start: bool = True) -> str:
+    """
+    Clean text for Text-to-Speech to avoid pronunciation of symbols and formatting.
+    Removes markdown formatting, bullet points, and other symbols that TTS might pronounce.
+    line_start=False is for a sentence cut from the middle of a line, which keeps
+    what looks like a list marker at its start ("2.5 kg" after "Use urea. ").
+    """
+    if not text:
+        return ""
+
+    # Remove markdown formatting
+    if '*' in text:
+        text = _BOLD_STAR.sub(r'\1', text)
+        text = _ITALIC_STAR.sub(r'\1', text)
+    if '_' in text:
+        text = _BOLD_UNDERSCORE.sub(r'\1', text)
+        text = _ITALIC_UNDERSCORE.sub(r'\1', text)
+    if '`' in text:
+        text = _INLINE_CODE.sub(r'\1', text)
+        text = _CODE_BLOCK.sub('', text)
+
+    # Remove bullet points, list markers and headers
+    if line_start:
+        if not _UNICODE_BULLET_CHARS.isdisjoint(text):
+            text = _UNICODE_BULLETS.sub('', text)
+        if not _ASCII_BULLET_CHARS.isdisjoint(text):
+            text = _ASCII_BULLETS.sub('', text)
+        if '.' in text:
+            text = _NUMBERED_LIST.sub('', text)
+        if '#' in text:
+            text = _HEADERS.sub('', text)
+
+    # Remove links
+    if '[' in text:
+        text = _MARKDOWN_LINK.sub(r'\1', text)
+    if '://' in text:
+        text = _RAW_URL.sub('', text)
+
+    # Remove symbols, then clean up punctuation and separators
+    text = _SYMBOLS.sub('', text)
+    text = _TEMPERATURE.sub(' degrees ', text)
+    text = _REPEATED_PUNCTUATION.sub(r'\1', text)
+    text = _DASHES.sub(', ', text)
+    if '/' in text:
+        text = text.replace('/', ' or ')
+    for pattern, reading in _ABBREVIATIONS:
+        text = pattern.sub(reading, text)
+
+    # Collapse all whitespace (including newlines) and trim
+    return ' '.join(text.split())
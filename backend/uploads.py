@@ -0,0 +1,202 @@
+"""
+Bounded-memory handling of uploaded audio and images.
+
+Starlette spools every multipart upload into a SpooledTemporaryFile (in memory up
+to 1 MB, on disk beyond that). Rather than reading the whole file, building its
+base64 text, a Python dict around it and then a serialized JSON copy of that dict,
+uploads are read from the spool in chunks with a size cap enforced as they go,
+and base64-encoded straight into one pre-sized JSON request body. Upload routes
+also sit behind UploadLimitMiddleware, so an oversized request body is refused
+before Starlette spools it at all.
+"""
+
+import binascii
+import hashlib
+import json
+import os
+
+from fastapi import UploadFile
+from fastapi.responses import JSONResponse
+
+import log
+
+MAX_AUDIO_BYTES = int(os.getenv("HASIRI_MAX_AUDIO_BYTES", str(10 * 1024 * 1024)))
+MAX_IMAGE_BYTES = int(os.getenv("HASIRI_MAX_IMAGE_BYTES", str(15 * 1024 * 1024)))
+
+CHUNK_SIZE = 3 * 64 * 1024  # A multiple of 3, so each chunk base64-encodes without padding
+SEND_CHUNK_SIZE = 64 * 1024
+
+# Multipart boundaries, part headers and small form fields around the uploaded file
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+# Stands in for the base64 value in a request template; must not need JSON escaping
+BASE64_PLACEHOLDER = "@@hasiri-base64@@"
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, size: int, max_bytes: int):
+        super().__init__(f"Upload of {size} bytes exceeds the {max_bytes} byte limit")
+        self.size = size
+        self.max_bytes = max_bytes
+
+
+class UploadLimitMiddleware:
+    """
+    ASGI middleware capping request bodies per path ({path: max_bytes}) with a 413:
+    up front from Content-Length, or (chunked uploads) as soon as the body received
+    so far passes the cap, instead of after the whole form has been spooled.
+    The per-file caps of check_size/read_upload still apply to the file itself.
+    """
+
+    def __init__(self, app, limits: dict):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        max_bytes = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if max_bytes is None:
+            return await self.app(scope, receive, send)
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit() and int(value) > max_bytes:
+                return await self._reject(scope, receive, send, UploadTooLarge(int(value), max_bytes))
+
+        received = 0
+        too_large = None
+        started = False
+
+        async def limited_receive():
+            nonlocal received, too_large
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    too_large = UploadTooLarge(received, max_bytes)
+                    raise too_large
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            if too_large is not None:
+                return  # Whatever the app makes of the aborted body is replaced below
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            # Form parsing may re-raise UploadTooLarge as something else
+            if too_large is None or started:
+                raise
+        if too_large is not None and not started:
+            await self._reject(scope, receive, send, too_large)
+
+    async def _reject(self, scope, receive, send, error: UploadTooLarge):
+        log.warning("upload.too_large", size=error.size, maxBytes=error.max_bytes)
+        response = JSONResponse(status_code=413, content={"error": str(error)}, headers={"Connection": "close"})
+        await response(scope, receive, send)
+
+
+class JSONBody:
+    """
+    A JSON request body held in one buffer. httpx sends it in chunks with its
+    Content-Length, and it can be iterated again when a request is retried.
+    """
+
+    def __init__(self, buffer: bytearray):
+        self.buffer = buffer
+
+    def __len__(self) -> int:
+        return len(self.buffer)
+
+    async def __aiter__(self):
+        view = memoryview(self.buffer)
+        for start in range(0, len(view), SEND_CHUNK_SIZE):
+            yield bytes(view[start:start + SEND_CHUNK_SIZE])
+
+    def headers(self) -> dict:
+        return {"Content-Type": "application/json", "Content-Length": str(len(self.buffer))}
+
+
+def upload_size(upload: UploadFile) -> int:
+    if upload.size is not None:
+        return upload.size
+    position = upload.file.tell()
+    upload.file.seek(0, os.SEEK_END)
+    size = upload.file.tell()
+    upload.file.seek(position)
+    return size
+
+
+def check_size(upload: UploadFile, max_bytes: int) -> int:
+    size = upload_size(upload)
+    if size > max_bytes:
+        raise UploadTooLarge(size, max_bytes)
+    return size
+
+
+async def read_upload(upload: UploadFile, max_bytes: int) -> bytes:
+    """
+    The whole upload, for callers that need the raw bytes (audio decoding).
+    Raises UploadTooLarge without reading anything when it is over max_bytes.
+    """
+    check_size(upload, max_bytes)
+    await upload.seek(0)
+    chunks = []
+    read = 0
+    while chunk := await upload.read(CHUNK_SIZE):
+        read += len(chunk)
+        if read > max_bytes:
+            raise UploadTooLarge(read, max_bytes)
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+async def _chunks(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)
+        for start in range(0, len(view), CHUNK_SIZE):
+            yield view[start:start + CHUNK_SIZE]
+        return
+    await source.seek(0)
+    while chunk := await source.read(CHUNK_SIZE):
+        yield chunk
+
+
+async def base64_json_body(template: dict, source, max_bytes: int = None) -> tuple:
+    """
+    Serialize template, which holds BASE64_PLACEHOLDER once as a string value,
+    with the base64 of source (bytes or an UploadFile) in its place.
+    Returns (JSONBody, sha256 hex digest of the source bytes).
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        size = len(source)
+    else:
+        size = check_size(source, max_bytes) if max_bytes is not None else upload_size(source)
+    prefix, suffix = json.dumps(template, ensure_ascii=False).encode("utf-8").split(
+        BASE64_PLACEHOLDER.encode("ascii"), 1
+    )
+    encoded_size = 4 * ((size + 2) // 3)
+    buffer = bytearray(len(prefix) + encoded_size + len(suffix))
+    buffer[:len(prefix)] = prefix
+    position = len(prefix)
+    digest = hashlib.sha256()
+    pending = b""  # Carried over when an upload read is not a multiple of 3 bytes
+    async for chunk in _chunks(source):
+        digest.update(chunk)
+        if pending:
+            chunk = pending + bytes(chunk)
+        usable = len(chunk) - len(chunk) % 3
+        pending = bytes(chunk[usable:])
+        encoded = binascii.b2a_base64(chunk[:usable], newline=False)
+        buffer[position:position + len(encoded)] = encoded
+        position += len(encoded)
+    if pending:
+        encoded = binascii.b2a_base64(pending, newline=False)
+        buffer[position:position + len(encoded)] = encoded
+        position += len(encoded)
+    if position != len(prefix) + encoded_size:
+        # The spooled file changed size under us; never send a corrupt body
+        raise ValueError(f"Upload size changed while encoding ({size} bytes expected)")
+    buffer[position:] = suffix
+    return JSONBody(buffer), digest.hexdigest()
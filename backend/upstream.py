@@ -0,0 +1,350 @@
+"""
+Shared async HTTP client pool for the Google upstreams (Gemini, Speech, TTS).
+
+One httpx.AsyncClient is kept per upstream for the whole application lifetime so
+connections are kept alive and TLS sessions are reused between requests. The pool
+is opened and closed from the FastAPI lifespan in main.py.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, fields
+
+import httpx
+
+import log
+import metrics
+import retry
+from breaker import CircuitBreaker, CircuitOpen
+from limiter import AdaptiveLimiter, UpstreamOverloaded, UpstreamUnavailable
+
+# httpx logs every request URL at INFO, and our URLs carry the API key
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+@dataclass
+class UpstreamConfig:
+    """
+    Connection pool, timeout, concurrency limiter and circuit breaker settings for one upstream.
+    Every field can be overridden with HASIRI_<NAME>_<FIELD> environment variables,
+    e.g. HASIRI_GEMINI_READ_TIMEOUT=90 or HASIRI_TTS_MAX_LIMIT=40.
+    """
+    name: str
+    max_connections: int = 50
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 60.0
+    connect_timeout: float = 5.0
+    read_timeout: float = 30.0
+    write_timeout: float = 30.0
+    pool_timeout: float = 5.0
+    initial_limit: int = 10
+    min_limit: int = 1
+    max_limit: int = 100
+    max_queue: int = 50
+    queue_timeout: float = 10.0
+    failure_rate_threshold: float = 0.5
+    minimum_calls: int = 10
+    window_seconds: float = 30.0
+    open_seconds: float = 15.0
+    half_open_max_calls: int = 2
+
+    @classmethod
+    def from_env(cls, name: str, **defaults) -> "UpstreamConfig":
+        config = cls(name=name, **defaults)
+        prefix = f"HASIRI_{name.upper()}_"
+        for field in fields(cls):
+            if field.name == "name":
+                continue
+            current = getattr(config, field.name)
+            parse = _env_int if isinstance(current, int) else _env_float
+            setattr(config, field.name, parse(prefix + field.name.upper(), current))
+        return config
+
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(
+            connect=self.connect_timeout,
+            read=self.read_timeout,
+            write=self.write_timeout,
+            pool=self.pool_timeout,
+        )
+
+    def limiter(self) -> AdaptiveLimiter:
+        return AdaptiveLimiter(
+            self.name,
+            initial_limit=self.initial_limit,
+            min_limit=self.min_limit,
+            max_limit=self.max_limit,
+            max_queue=self.max_queue,
+            queue_timeout=self.queue_timeout,
+        )
+
+    def breaker(self) -> CircuitBreaker:
+        return CircuitBreaker(
+            self.name,
+            failure_rate_threshold=self.failure_rate_threshold,
+            minimum_calls=self.minimum_calls,
+            window_seconds=self.window_seconds,
+            open_seconds=self.open_seconds,
+            half_open_max_calls=self.half_open_max_calls,
+        )
+
+
+# Gemini 2.5 Pro answers can take well over 30 seconds, speech calls are shorter
+UPSTREAMS = {
+    "gemini": UpstreamConfig.from_env("gemini", read_timeout=90.0),
+    "speech": UpstreamConfig.from_env("speech", read_timeout=60.0),
+    "tts": UpstreamConfig.from_env("tts", read_timeout=30.0),
+}
+
+
+class UpstreamPool:
+    """
+    Holds one keep-alive AsyncClient per upstream.
+    All clients share a single SSL context so TLS sessions can be resumed.
+    """
+
+    def __init__(self, configs: dict):
+        self.configs = configs
+        self._clients = {}
+
+    @property
+    def started(self) -> bool:
+        return bool(self._clients)
+
+    async def start(self):
+        if self._clients:
+            return
+        ssl_context = httpx.create_ssl_context()
+        for name, config in self.configs.items():
+            self._clients[name] = httpx.AsyncClient(
+                limits=config.limits(),
+                timeout=config.timeout(),
+                verify=ssl_context,
+                headers={"Content-Type": "application/json"},
+            )
+        log.info("upstream.pool_started", upstreams=", ".join(self._clients))
+
+    async def aclose(self):
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+        if clients:
+            log.info("upstream.pool_closed")
+
+    def client(self, upstream: str) -> httpx.AsyncClient:
+        if upstream not in self._clients:
+            raise RuntimeError(f"Upstream pool not started or unknown upstream: {upstream}")
+        return self._clients[upstream]
+
+
+pool = UpstreamPool(UPSTREAMS)
+
+limiters = {name: config.limiter() for name, config in UPSTREAMS.items()}
+breakers = {name: config.breaker() for name, config in UPSTREAMS.items()}
+for _name in UPSTREAMS:
+    metrics.register_gauge(f"limiter.{_name}", limiters[_name].stats)
+    metrics.register_gauge(f"breaker.{_name}", breakers[_name].stats)
+metrics.register_gauge("retry_budget", retry.budget.stats)
+
+
+def is_healthy_status(status_code: int) -> bool:
+    return status_code != 429 and status_code < 500
+
+
+async def post(upstream: str, url: str, *, params: dict = None, json: dict = None, content=None) -> httpx.Response:
+    """
+    POST a JSON body to an upstream through its pooled client, retrying
+    retryable failures (429/5xx/timeouts) within the process-wide retry budget.
+    Raises CircuitOpen while the upstream's breaker is open and UpstreamOverloaded
+    when its concurrency limiter queue is full; neither is retried.
+    content may replace json with an already serialized body (an uploads.JSONBody).
+    """
+    retry.budget.record_request()
+    delay = retry.policy.base_delay
+    attempt = 1
+    while True:
+        try:
+            response = await _send(upstream, url, params, json, content)
+        except Exception as exc:
+            if (
+                not retry.policy.is_retryable_error(exc)
+                or attempt >= retry.policy.max_attempts
+                or not retry.budget.try_spend()
+            ):
+                raise
+            delay = retry.policy.delay_for(delay)
+            reason = type(exc).__name__
+        else:
+            if attempt >= retry.policy.max_attempts or not retry.policy.is_retryable_status(response.status_code):
+                return response
+            next_delay = retry.policy.delay_for(delay, response)
+            if next_delay is None or not retry.budget.try_spend():
+                return response
+            delay = next_delay
+            reason = response.status_code
+
+        metrics.incr(f"retry.{upstream}")
+        log.warning("upstream.retry", upstream=upstream, reason=reason, delay=round(delay, 2), attempt=attempt + 1)
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+async def _send(upstream: str, url: str, params: dict, json: dict, content=None) -> httpx.Response:
+    """
+    A single attempt, guarded by the upstream's circuit breaker and concurrency limiter.
+    """
+    breaker = breakers[upstream]
+    limiter = limiters[upstream]
+    breaker.before_call()
+    try:
+        await limiter.acquire()
+    except BaseException:
+        breaker.record(None)
+        raise
+
+    start = time.monotonic()
+    healthy = False
+    try:
+        if content is not None:
+            response = await pool.client(upstream).post(url, params=params, content=content, headers=content.headers())
+        else:
+            response = await pool.client(upstream).post(url, params=params, json=json)
+        healthy = is_healthy_status(response.status_code)
+        return response
+    except asyncio.CancelledError:
+        healthy = None
+        raise
+    finally:
+        latency = time.monotonic() - start
+        limiter.release(latency, healthy)
+        breaker.record(healthy)
+        if healthy:
+            latency_trackers[upstream].add(latency)
+
+
+@asynccontextmanager
+async def stream(upstream: str, url: str, *, params: dict = None, json: dict = None):
+    """
+    Open a streaming POST to an upstream and yield the httpx.Response.
+    Guarded by the breaker and limiter like post(); the limiter slot is held
+    until the stream is closed. Streams are not retried once opened.
+    """
+    breaker = breakers[upstream]
+    limiter = limiters[upstream]
+    breaker.before_call()
+    try:
+        await limiter.acquire()
+    except BaseException:
+        breaker.record(None)
+        raise
+
+    start = time.monotonic()
+    latency = None
+    healthy = False
+    try:
+        async with pool.client(upstream).stream("POST", url, params=params, json=json) as response:
+            # Time to response headers is the comparable latency signal for the limiter
+            latency = time.monotonic() - start
+            healthy = is_healthy_status(response.status_code)
+            yield response
+    except (asyncio.CancelledError, GeneratorExit):
+        # Client went away mid-stream, not an upstream failure
+        healthy = None
+        raise
+    finally:
+        limiter.release(latency if latency is not None else time.monotonic() - start, healthy)
+        breaker.record(healthy)
+
+
+class LatencyTracker:
+    """
+    Recent successful call latencies, used to derive hedging delays.
+    """
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def add(self, latency: float):
+        self._samples.append(latency)
+
+    def percentile(self, q: float) -> float:
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+latency_trackers = {name: LatencyTracker() for name in UPSTREAMS}
+
+HEDGE_MIN_SAMPLES = int(os.getenv("HASIRI_HEDGE_MIN_SAMPLES", "20"))
+HEDGE_PERCENTILE = float(os.getenv("HASIRI_HEDGE_PERCENTILE", "0.95"))
+
+
+def hedge_delay(upstream: str):
+    """
+    Delay before firing a hedge, or None when there is no reliable p95 yet
+    or the upstream has no spare capacity for the extra request.
+    """
+    tracker = latency_trackers[upstream]
+    limiter = limiters[upstream]
+    if len(tracker) < HEDGE_MIN_SAMPLES or breakers[upstream].state != "closed":
+        return None
+    if limiter.in_flight >= int(limiter.limit) or limiter.queued:
+        return None
+    return tracker.percentile(HEDGE_PERCENTILE)
+
+
+async def hedged_post(upstream: str, url: str, *, params: dict = None, json: dict = None) -> httpx.Response:
+    """
+    Like post(), but fires a second identical request if the first has not
+    answered within the upstream's recent p95 latency. The first healthy
+    response wins and the other request is cancelled.
+    """
+    delay = hedge_delay(upstream)
+    if delay is None:
+        return await post(upstream, url, params=params, json=json)
+
+    primary = asyncio.create_task(post(upstream, url, params=params, json=json))
+    tasks = {primary}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done and hedge_delay(upstream) is not None:
+            metrics.incr(f"hedge.{upstream}.fired")
+            tasks.add(asyncio.create_task(post(upstream, url, params=params, json=json)))
+
+        fallback = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None and is_healthy_status(task.result().status_code):
+                    if task is not primary:
+                        metrics.incr(f"hedge.{upstream}.won")
+                    return task.result()
+                fallback = fallback or task
+        # Neither request was healthy, surface the first outcome as post() would
+        return fallback.result()
+    finally:
+        for task in tasks:
+            task.cancel()